@@ -1,6 +1,16 @@
+import os
+import re
+import sys
+import json
 import uuid
+import zlib
+import base64
+import bisect
+from pathlib import Path
 from functools import partial
-from multiprocessing import Pool
+from itertools import accumulate
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from difflib import SequenceMatcher
 from matplotlib.animation import HTMLWriter, _log
 
@@ -14,8 +24,19 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
     /* MSIE used to detect old browsers and Trident used to newer ones*/
     return ua.indexOf("MSIE ") > -1 || ua.indexOf("Trident/") > -1;
   }
+  /* Call back on the next animation frame, or after a timeout where there are none */
+  function requestFrame(callback) {
+    if (typeof requestAnimationFrame !== "undefined") return requestAnimationFrame(callback);
+    return setTimeout(function() { callback(performance.now()); }, 16);
+  }
+  function cancelFrame(handle) {
+    if (typeof cancelAnimationFrame !== "undefined") cancelAnimationFrame(handle);
+    else clearTimeout(handle);
+  }
   /* Define the Animation class */
-  function Animation(diff_frames, checkpoint_frames, img_id, slider_id, interval, loop_select_id){
+  function Animation(diff_frames, checkpoint_frames, img_id, slider_id, interval, loop_select_id,
+                     frame_prefix, reverse_frames, cache_size, segments, segment_dir,
+                     stats_id){
     this.img_id = img_id;
     this.slider_id = slider_id;
     this.loop_select_id = loop_select_id;
@@ -23,9 +44,30 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
     this.current_frame = 0;
     this.direction = 0;
     this.timer = null;
+    this.stats = {fps: 0, shown: 0, dropped: 0};
+    this.stats_id = stats_id;
+    this.fps_start = null;
+    this.fps_frames = 0;
     this.num_frames = diff_frames.length + 1;
     this.diff_frames = diff_frames;
+    // reverse_frames[i] is the diff from frame i + 1 back to frame i, if any
+    this.reverse_frames = reverse_frames || [];
     this.checkpoint_frames = checkpoint_frames;
+    this.checkpoints = segments ||
+        Object.keys(checkpoint_frames).map(Number).sort(function(a, b){return a - b;});
+    // If frames aren't embedded, the i-th segment holds the i-th checkpoint and the diffs
+    // up to the next one, it is loaded from segment_dir on demand
+    this.segment_dir = segment_dir;
+    this.segment_state = {};
+    this.pending_frame = undefined;
+    // Frames are either data URIs or, if a prefix is given, the decoded files as binary strings
+    this.frame_prefix = frame_prefix;
+    this.frame_data = undefined;
+    this.data_frame = -1;
+    // LRU cache of computed frames, a Map iterates in insertion order
+    this.cache = new Map();
+    this.cache_bytes = 0;
+    this.cache_size = cache_size || 0;
 
     var slider = document.getElementById(this.slider_id);
     slider.max = this.num_frames - 1;
@@ -48,30 +90,138 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
     }
     return undefined;
   }
+  Animation.prototype.segment_of = function(frame){
+    // Binary search for the last checkpoint at or before frame
+    let lo = 0, hi = this.checkpoints.length - 1;
+    while (lo < hi) {
+      let mid = (lo + hi + 1) >> 1;
+      if (this.checkpoints[mid] <= frame) lo = mid;
+      else hi = mid - 1;
+    }
+    return lo;
+  }
+  Animation.prototype.checkpoint_before = function(frame){
+    return this.checkpoints[this.segment_of(frame)];
+  }
+  Animation.prototype.segments_loaded = function(first, last){
+    for (let segment = first; this.segment_dir && segment <= last; segment++) {
+      if (this.segment_state[segment] !== "loaded") return false;
+    }
+    return true;
+  }
+  Animation.prototype.load_segment = function(segment){
+    // Request a segment, its script calls add_segment once loaded
+    if (!this.segment_dir || this.segment_state[segment] ||
+        segment < 0 || segment >= this.checkpoints.length) return;
+    this.segment_state[segment] = "loading";
+    let script = document.createElement("script");
+    script.src = this.segment_dir + "/segment" + segment + ".js";
+    document.head.appendChild(script);
+  }
+  Animation.prototype.add_segment = function(segment, checkpoint_frames, diff_frames, reverse_frames){
+    Object.assign(this.checkpoint_frames, checkpoint_frames);
+    for (let i in diff_frames) this.diff_frames[i] = diff_frames[i];
+    for (let i in reverse_frames) this.reverse_frames[i] = reverse_frames[i];
+    this.segment_state[segment] = "loaded";
+    if (this.pending_frame !== undefined && this.segment_of(this.pending_frame) === segment) {
+      let frame = this.pending_frame;
+      this.pending_frame = undefined;
+      this.set_frame(frame);
+    }
+  }
+  Animation.prototype.unload_segment = function(segment){
+    let start = this.checkpoints[segment];
+    let end = segment + 1 < this.checkpoints.length ? this.checkpoints[segment + 1] : this.num_frames;
+    delete this.checkpoint_frames[start];
+    // The diff into a checkpoint isn't needed, the reverse one belongs to its segment
+    for (let i = start - 1; i < end - 1; i++) {
+      delete this.diff_frames[i];
+      delete this.reverse_frames[i];
+    }
+    delete this.segment_state[segment];
+  }
+  Animation.prototype.prefetch = function(segment){
+    // Load the next segment in the direction of playback and drop far away ones,
+    // so that only a few segments are ever in memory
+    this.load_segment(this.direction < 0 ? segment - 1 : segment + 1);
+    for (let other in this.segment_state) {
+      if (Math.abs(other - segment) > 2 && this.segment_state[other] === "loaded") {
+        this.unload_segment(Number(other));
+      }
+    }
+  }
+  Animation.prototype.cache_get = function(frame){
+    // Move frame to the most recently used end
+    let data = this.cache.get(frame);
+    this.cache.delete(frame);
+    this.cache.set(frame, data);
+    return data;
+  }
+  Animation.prototype.cache_put = function(frame, data){
+    if (data.length > this.cache_size || this.cache.has(frame)) return;
+    this.cache.set(frame, data);
+    this.cache_bytes += data.length;
+    for (const [key, value] of this.cache) {
+      if (this.cache_bytes <= this.cache_size) break;
+      this.cache.delete(key);
+      this.cache_bytes -= value.length;
+    }
+  }
+  Animation.prototype.cached_before = function(frame){
+    // Last cached frame at or before frame, -1 if there is none
+    let best = -1;
+    for (const key of this.cache.keys()) {
+      if (key <= frame && key > best) best = key;
+    }
+    return best;
+  }
   Animation.prototype.set_frame = function(frame){
-    let base = undefined, start = undefined;
-    if (this.checkpoint_frames.hasOwnProperty(frame)) {
-      // Check if requested frame is checkpointed
-      base = this.checkpoint_frames[frame];
-    } else {
-      // Apply diffs in order to reach target frame
-      // we could cache computer frames, of have "reverse"
-      // diff, or a tree structure, but for now simply recompute.
-      if (this.current_frame < frame) {
-        start = Math.max(0, this.current_frame);
-        base = document.getElementById(this.img_id).src;
-      } else {
-        start = 0;
-        base = this.checkpoint_frames[0];
+    // Apply diffs in order to reach target frame, starting from the closest
+    // checkpoint, cached frame or last computed frame. If there are reverse
+    // diffs, step backwards from the last computed frame when that takes
+    // fewer diffs.
+    let segment = this.segment_of(frame);
+    if (!this.segments_loaded(segment, segment)) {
+      // Show the frame once its segment is loaded
+      this.pending_frame = frame;
+      this.load_segment(segment);
+      this.current_frame = frame;
+      document.getElementById(this.slider_id).value = this.current_frame;
+      return;
+    }
+    this.pending_frame = undefined;
+    let start = this.checkpoints[segment], base = this.checkpoint_frames[start];
+    let cached = this.cached_before(frame);
+    if (cached > start) {
+      start = cached;
+      base = this.cache_get(cached);
+    }
+    if (start <= this.data_frame && this.data_frame <= frame) {
+      start = this.data_frame;
+      base = this.frame_data;
+    }
+    if (this.reverse_frames.length && frame < this.data_frame &&
+        this.data_frame - frame < frame - start &&
+        this.segments_loaded(segment, this.segment_of(this.data_frame))) {
+      base = this.frame_data;
+      for (let i = this.data_frame - 1; i >= frame; i--) {
+        base = applyPatch(base, this.reverse_frames[i]);
       }
+    } else {
       for (let i = start; i < frame; i++) {
         base = applyPatch(base, this.diff_frames[i]);
       }
     }
 
+    if (this.checkpoint_frames[frame] === undefined) {
+      this.cache_put(frame, base);
+    }
     this.current_frame = frame;
-    document.getElementById(this.img_id).src = base;
+    this.data_frame = frame;
+    this.frame_data = base;
+    document.getElementById(this.img_id).src = this.frame_prefix ? this.frame_prefix + btoa(base) : base;
     document.getElementById(this.slider_id).value = this.current_frame;
+    this.prefetch(segment);
   }
   Animation.prototype.next_frame = function()
   {
@@ -101,9 +251,9 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
     if(this.direction > 0){this.play_animation();}
     else if(this.direction < 0){this.reverse_animation();}
   }
-  Animation.prototype.anim_step_forward = function()
+  Animation.prototype.anim_step_forward = function(steps)
   {
-    this.current_frame += 1;
+    this.current_frame += steps || 1;
     if(this.current_frame < this.num_frames){
       this.set_frame(this.current_frame);
     }else{
@@ -119,9 +269,9 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
       }
     }
   }
-  Animation.prototype.anim_step_reverse = function()
+  Animation.prototype.anim_step_reverse = function(steps)
   {
-    this.current_frame -= 1;
+    this.current_frame -= steps || 1;
     if(this.current_frame >= 0){
       this.set_frame(this.current_frame);
     }else{
@@ -141,7 +291,7 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
   {
     this.direction = 0;
     if (this.timer){
-      clearInterval(this.timer);
+      cancelFrame(this.timer);
       this.timer = null;
     }
   }
@@ -149,51 +299,268 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
   {
     this.pause_animation();
     this.direction = 1;
-    var t = this;
-    if (!this.timer) this.timer = setInterval(function() {
-        t.anim_step_forward();
-    }, this.interval);
+    this.schedule_steps();
   }
   Animation.prototype.reverse_animation = function()
   {
     this.pause_animation();
     this.direction = -1;
-    var t = this;
-    if (!this.timer) this.timer = setInterval(function() {
-        t.anim_step_reverse();
-    }, this.interval);
+    this.schedule_steps();
+  }
+  Animation.prototype.schedule_steps = function()
+  {
+    // Step on animation frames by as many frames as intervals have passed, so that
+    // frames are dropped rather than piling up when they take longer than the interval
+    var t = this, last = null;
+    this.fps_start = null;
+    function tick(now) {
+      t.timer = requestFrame(tick);
+      if (last === null) last = now;
+      var steps = Math.floor((now - last) / t.interval);
+      if (steps < 1) return;
+      last += steps * t.interval;
+      t.count_frame(now, steps - 1);
+      if (t.direction > 0) t.anim_step_forward(steps);
+      else t.anim_step_reverse(steps);
+    }
+    this.timer = requestFrame(tick);
+  }
+  Animation.prototype.count_frame = function(now, dropped)
+  {
+    // Frames shown and dropped while playing, and the frame rate over the last half second
+    this.stats.shown += 1;
+    this.stats.dropped += dropped;
+    if (this.fps_start === null || now - this.fps_start >= 500) {
+      if (this.fps_start !== null) {
+        this.stats.fps = this.fps_frames * 1000 / (now - this.fps_start);
+        document.getElementById(this.stats_id).textContent =
+            this.stats.fps.toFixed(1) + " fps, " + this.stats.dropped + " dropped";
+      }
+      this.fps_start = now;
+      this.fps_frames = 0;
+    }
+    this.fps_frames += 1;
   }
 
   /**
-  * Apply the diff patch to the input string
+  * Apply the diff patch to the input string. The patch's [low, high, data]
+  * operations replace base.slice(low, high) with data (i.e: it's a delete if
+  * data is empty and an insert if low === high), they must be sorted by offset
+  * and not overlap so that the output is built in a single pass over slices.
   * @param {string} base
   * @param {Array<Array<>>} patch
   */
   function applyPatch(base, patch) {
-    let target = base.split('');
+    let target = '', pos = 0;
     for (let [low, high, data] of patch) {
-      // Infer operation type based on indices and data
-      // If data is the emtpy string then it's a delete op
-      // If both indices are equal it's an insert op
-      // Otherwise assume replace op as patch is well formed
-      if (!data) {
-        // Delete Op
-        for (let i = low; i < high; i++)
-          target[i] = '';
-      } else if (low === high) {
-        // Insert Op
-        if (low >= target.length)
-          target.push(data);
-        else
-          target[low] = data + target[low];
+      target += base.slice(pos, low) + data;
+      pos = high;
+    }
+    return target + base.slice(pos);
+  }
+
+  /**
+  * Unpack diffs embedded as a single JSON document mapping frames to their
+  * flattened [low, high, data, low, high, data, ...] operations, data being
+  * base64-encoded if binary.
+  * @param {string} packed
+  * @param {boolean} binary
+  */
+  function unpackJSON(packed, binary) {
+    let diffs = JSON.parse(packed);
+    for (let i in diffs) {
+      let ops = diffs[i], patch = [];
+      for (let j = 0; j < ops.length; j += 3) {
+        patch.push([ops[j], ops[j + 1], binary ? atob(ops[j + 2]) : ops[j + 2]]);
+      }
+      diffs[i] = patch;
+    }
+    return diffs;
+  }
+
+  /**
+  * Unpack diffs embedded as base64-encoded varints: for each frame the
+  * difference with the previous frame's index and its number of operations,
+  * then for each operation low minus the previous high, high minus low and the
+  * length of its data. The data of all operations is concatenated in data.
+  * @param {string} numbers
+  * @param {string} data
+  */
+  function unpackVarint(numbers, data) {
+    // Decode all the varints at once
+    let bytes = atob(numbers), values = new Uint32Array(bytes.length), count = 0;
+    for (let i = 0, n = 0, scale = 1; i < bytes.length; i++) {
+      let b = bytes.charCodeAt(i);
+      n += (b & 0x7f) * scale;
+      if (b & 0x80) {
+        scale *= 128;
       } else {
-        // Replace Op
-        for (let i = low; i < high; i++)
-          target[i] = '';
-        target[low] = data;
+        values[count++] = n;
+        n = 0;
+        scale = 1;
       }
     }
-    return target.join('');
+    let pos = 0, offset = 0, frame = 0, diffs = {};
+    while (pos < count) {
+      frame += values[pos++];
+      let patch = [], high = 0;
+      for (let ops = values[pos++]; ops > 0; ops--, pos += 3) {
+        let low = high + values[pos];
+        high = low + values[pos + 1];
+        patch.push([low, high, data.slice(offset, offset += values[pos + 2])]);
+      }
+      diffs[frame] = patch;
+    }
+    return diffs;
+  }
+
+  /**
+  * Decode base64 into bytes
+  * @param {string} b64
+  */
+  function decodeBase64(b64) {
+    let binary = atob(b64), bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+    return bytes;
+  }
+
+  /**
+  * Minimal DEFLATE (RFC 1951) decoder, for browsers without DecompressionStream
+  * @param {Uint8Array} data
+  */
+  function inflateRaw(data) {
+    const LBASE = [3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31, 35, 43, 51, 59, 67, 83, 99,
+                   115, 131, 163, 195, 227, 258];
+    const LEXT = [0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5, 5, 0];
+    const DBASE = [1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193, 257, 385, 513, 769, 1025,
+                   1537, 2049, 3073, 4097, 6145, 8193, 12289, 16385, 24577];
+    const DEXT = [0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 8, 8, 9, 9, 10, 10, 11, 11, 12,
+                  12, 13, 13];
+    const ORDER = [16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15];
+    let out = new Uint8Array(Math.max(4 * data.length, 1024)), len = 0;
+    let pos = 0, bitbuf = 0, bitcnt = 0;
+    function bits(n) {
+      while (bitcnt < n) {
+        bitbuf |= data[pos++] << bitcnt;
+        bitcnt += 8;
+      }
+      let value = bitbuf & ((1 << n) - 1);
+      bitbuf >>>= n;
+      bitcnt -= n;
+      return value;
+    }
+    function put(byte) {
+      if (len === out.length) {
+        let grown = new Uint8Array(2 * len);
+        grown.set(out);
+        out = grown;
+      }
+      out[len++] = byte;
+    }
+    // Canonical huffman code, as the number of codes of each length and the symbols in code order
+    function huffman(lengths) {
+      let counts = new Uint16Array(16), offsets = new Uint16Array(16), symbols = new Uint16Array(lengths.length);
+      for (let i = 0; i < lengths.length; i++) counts[lengths[i]]++;
+      counts[0] = 0;
+      for (let i = 1; i < 16; i++) offsets[i] = offsets[i - 1] + counts[i - 1];
+      for (let i = 0; i < lengths.length; i++) if (lengths[i]) symbols[offsets[lengths[i]]++] = i;
+      return {counts: counts, symbols: symbols};
+    }
+    function decode(code) {
+      for (let length = 1, value = 0, first = 0, index = 0; length < 16; length++) {
+        value |= bits(1);
+        let count = code.counts[length];
+        if (value - first < count) return code.symbols[index + value - first];
+        index += count;
+        first = (first + count) << 1;
+        value <<= 1;
+      }
+      throw new Error("invalid deflate data");
+    }
+    let last;
+    do {
+      last = bits(1);
+      let type = bits(2);
+      if (type === 0) {
+        // Stored block, starting at the next byte
+        bitbuf = bitcnt = 0;
+        let n = data[pos] | data[pos + 1] << 8;
+        pos += 4;
+        for (let end = pos + n; pos < end; ) put(data[pos++]);
+        continue;
+      }
+      let lit, dist;
+      if (type === 1) {
+        let lengths = new Uint8Array(288);
+        lengths.fill(8, 0, 144).fill(9, 144, 256).fill(7, 256, 280).fill(8, 280);
+        lit = huffman(lengths);
+        dist = huffman(new Uint8Array(30).fill(5));
+      } else {
+        let nlen = bits(5) + 257, ndist = bits(5) + 1, ncode = bits(4) + 4;
+        let lengths = new Uint8Array(19);
+        for (let i = 0; i < ncode; i++) lengths[ORDER[i]] = bits(3);
+        let code = huffman(lengths);
+        lengths = new Uint8Array(nlen + ndist);
+        for (let i = 0; i < nlen + ndist; ) {
+          let symbol = decode(code);
+          if (symbol < 16) {
+            lengths[i++] = symbol;
+          } else {
+            let repeat, value = 0;
+            if (symbol === 16) {
+              value = lengths[i - 1];
+              repeat = 3 + bits(2);
+            } else {
+              repeat = symbol === 17 ? 3 + bits(3) : 11 + bits(7);
+            }
+            while (repeat--) lengths[i++] = value;
+          }
+        }
+        lit = huffman(lengths.subarray(0, nlen));
+        dist = huffman(lengths.subarray(nlen));
+      }
+      for (let symbol = decode(lit); symbol !== 256; symbol = decode(lit)) {
+        if (symbol < 256) {
+          put(symbol);
+        } else {
+          symbol -= 257;
+          let length = LBASE[symbol] + bits(LEXT[symbol]);
+          symbol = decode(dist);
+          let distance = DBASE[symbol] + bits(DEXT[symbol]);
+          for (let i = 0; i < length; i++) put(out[len - distance]);
+        }
+      }
+    } while (!last);
+    return out.subarray(0, len);
+  }
+
+  /**
+  * Inflate base64 zlib data into a string, with DecompressionStream where available
+  * @param {string} b64
+  */
+  function inflate(b64) {
+    let bytes = decodeBase64(b64);
+    if (typeof DecompressionStream !== "undefined") {
+      let stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("deflate"));
+      return new Response(stream).text();
+    }
+    // Skip the zlib header, the payload is ascii
+    let data = inflateRaw(bytes.subarray(2)), text = "";
+    for (let i = 0; i < data.length; i += 0x8000) {
+      text += String.fromCharCode.apply(null, data.subarray(i, i + 0x8000));
+    }
+    return Promise.resolve(text);
+  }
+
+  /**
+  * Run the compressed statements filling the checkpoint, diff and reverse frames
+  * @param {string} b64
+  */
+  function inflateFrames(b64, checkpoint_frames, diff_frames, reverse_frames) {
+    return inflate(b64).then(function(code) {
+      new Function("checkpoint_frames", "diff_frames", "reverse_frames", code)(
+        checkpoint_frames, diff_frames, reverse_frames);
+    });
   }
 </script>
 """
@@ -224,6 +591,10 @@ input[type=range].anim-slider {
     margin: 0;
     vertical-align: middle;
 }
+.anim-stats {
+    font-size: small;
+    opacity: 0.6;
+}
 </style>
 """
 
@@ -267,6 +638,7 @@ DISPLAY_TEMPLATE = """
              {reflect_checked}>
       <label for="_anim_radio3_{id}">Reflect</label>
     </form>
+    <div id="_anim_stats{id}" class="anim-stats"></div>
   </div>
 </div>
 <script language="javascript">
@@ -276,21 +648,43 @@ DISPLAY_TEMPLATE = """
     var img_id = "_anim_img{id}";
     var slider_id = "_anim_slider{id}";
     var loop_select_id = "_anim_loop_select{id}";
+    var stats_id = "_anim_stats{id}";
 
     var diff_frames = new Array({Ndiffs});
     {diff_frames}
     var checkpoint_frames = new Object();
     {fill_frames}
+    var reverse_frames = new Array();
+    {reverse_frames}
+    /* compressed frames are filled in asynchronously */
+    var loading = {compressed};
     /* set a timeout to make sure all the above elements are created before
        the object is initialized. */
     setTimeout(function() {{
-        anim{id} = new Animation(diff_frames, checkpoint_frames, img_id, slider_id, {interval},
-                                 loop_select_id);
+        Promise.resolve(loading).then(function() {{
+            anim{id} = new Animation(diff_frames, checkpoint_frames, img_id, slider_id, {interval},
+                                     loop_select_id, "{frame_prefix}", reverse_frames, {cache_size},
+                                     {segments}, "{segment_dir}", stats_id);
+        }});
     }}, 0);    
   }})()
 </script>
 """
 
+# Javascript for a segment of the animation, when frames aren't embedded
+SEGMENT_TEMPLATE = """(function() {{
+    var checkpoint_frames = new Object();
+    {fill_frames}
+    var diff_frames = new Object();
+    {diff_frames}
+    var reverse_frames = new Object();
+    {reverse_frames}
+    Promise.resolve({compressed}).then(function() {{
+        anim{id}.add_segment({segment}, checkpoint_frames, diff_frames, reverse_frames);
+    }});
+}})()
+"""
+
 
 def _add_base64_prefix(frame_list, frame_format):
     """frame_list should be a list of base64-encoded files"""
@@ -301,56 +695,707 @@ def _add_base64_prefix(frame_list, frame_format):
     return [template.format(frame_format, frame_data) for frame_data in frame_list]
 
 
-def _embedded_checkpoint_frames(prefixed_frame_dict):
-    """prefixed_frame_dict should be a dict of base64-encoded files, with prefix"""
-    template = '    checkpoint_frames[{0}] = "{1}"\n'
-    return "\n" + "".join(template.format(i, frame_data.replace('\n', '\\\n'))
-                          for i, frame_data in prefixed_frame_dict.items())
+def _js_string(data, binary=False):
+    """javascript expression for a string, binary strings are embedded as base64"""
+    if binary:
+        return 'atob("{0}")'.format(base64.b64encode(data.encode('latin-1')).decode('ascii'))
+    # Escape '</' so that svg text can't close the script tag early
+    return json.dumps(data).replace('</', '<\\/')
+
+
+def _embedded_checkpoint_frames(prefixed_frame_dict, binary=False):
+    """prefixed_frame_dict should be a dict of base64-encoded files, with prefix, or of decoded files"""
+    template = '    checkpoint_frames[{0}] = {1}\n'
+    yield "\n"
+    for i, frame_data in prefixed_frame_dict.items():
+        yield template.format(i, _js_string(frame_data, binary))
+
+
+def _write_template(of, template, chunks, **kwargs):
+    """
+    Format template into the file of, the placeholders named in chunks being filled with
+    the strings their iterable yields, written as they are produced rather than joined.
+    """
+    pattern = '(' + '|'.join(re.escape('{' + name + '}') for name in chunks) + ')'
+    for part in re.split(pattern, template):
+        if part.startswith('{') and part[1:-1] in chunks:
+            for chunk in chunks[part[1:-1]]:
+                of.write(chunk)
+        else:
+            of.write(part.format(**kwargs))
 
 
-def _diff_frames(frame1, frame2):
-    """diff two base64-encoded frames"""
-    # Ignore line-wraps as per RFC 4648
-    s = SequenceMatcher(None, frame1.replace('\n', ''), frame2.replace('\n', ''))
-    diff = [[i1, i2, frame2[j1:j2]] for tag, i1, i2, j1, j2 in s.get_opcodes() if tag != 'equal']
-    return diff
+class _Compressor:
+    """
+    Zlib-compresses the strings written to it in a background thread, in order, so that
+    compression overlaps with whatever produces them (zlib releases the GIL).
+    """
+    def __init__(self, level=-1):
+        self._compressor = zlib.compressobj(level)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._chunks = []
 
+    def write(self, data):
+        self._chunks.append(self._executor.submit(self._compressor.compress, data.encode('ascii')))
 
-def _embedded_diff_frames(frames, parallel=False):
-    frame_pairs = []
-    prev_frame = frames[0]
-    for next_frame in frames[1:]:
-        frame_pairs.append((prev_frame, next_frame))
-        prev_frame = next_frame
+    def getvalue(self):
+        self._chunks.append(self._executor.submit(self._compressor.flush))
+        self._executor.shutdown()
+        return b''.join(chunk.result() for chunk in self._chunks)
 
-    if parallel:
-        with Pool() as p:
-            diffs = p.starmap(_diff_frames, frame_pairs)
-    else:
-        diffs = [_diff_frames(*fp) for fp in frame_pairs]
 
-    template = '    diff_frames[{0}] = {1}\n'
-    return "\n" + "".join(
-        template.format(i, frame_data)
-        for i, frame_data in enumerate(diffs))
+def _compressed_frames(compressor, *chunks):
+    """javascript expression for the promise of filling the frames with the statements
+    compressed so far, followed by chunks"""
+    for chunk in chunks:
+        for data in chunk:
+            compressor.write(data)
+    yield 'inflateFrames("'
+    yield base64.b64encode(compressor.getvalue()).decode('ascii')
+    yield '", checkpoint_frames, diff_frames, reverse_frames)'
+
+
+# Tokens used by the myers backend: runs ending in a delimiter, capped in length so that
+# delimiter-free data (such as base64) is cut in fixed-width chunks that stay aligned.
+_TOKENS = re.compile(r'[^\s<>"/+]{0,15}[\s<>"/+]|[^\s<>"/+]{1,16}')
+
+
+def _match_forward(a, b, i, j, n):
+    """length of the common run starting at a[i] and b[j], at most n long"""
+    if n <= 0 or a[i] != b[j]:
+        return 0
+    # Gallop using slice comparisons, which run at C speed, then bisect the mismatch
+    k, step = 1, 1
+    while k < n:
+        step = min(2 * step, n - k)
+        if a[i + k:i + k + step] == b[j + k:j + k + step]:
+            k += step
+            continue
+        lo, hi = 0, step
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if a[i + k:i + k + mid] == b[j + k:j + k + mid]:
+                lo = mid
+            else:
+                hi = mid
+        return k + lo
+    return k
+
+
+def _match_backward(a, b, i, j, n):
+    """length of the common run ending just before a[i] and b[j], at most n long"""
+    if n <= 0 or a[i - 1] != b[j - 1]:
+        return 0
+    k, step = 1, 1
+    while k < n:
+        step = min(2 * step, n - k)
+        if a[i - k - step:i - k] == b[j - k - step:j - k]:
+            k += step
+            continue
+        lo, hi = 0, step
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if a[i - k - mid:i - k] == b[j - k - mid:j - k]:
+                lo = mid
+            else:
+                hi = mid
+        return k + lo
+    return k
+
+
+def _myers_split(a, b, xoff, xlim, yoff, ylim, max_cost):
+    """
+    Find the middle snake of a[xoff:xlim] and b[yoff:ylim], as in Myers' linear space
+    refinement. After max_cost edit steps we give up and, like GNU diff, split at the
+    furthest reaching path found so far.
+    """
+    dmin, dmax = xoff - ylim, xlim - yoff
+    fmid, bmid = xoff - yoff, xlim - ylim
+    odd = (fmid - bmid) & 1
+    fd, bd = {fmid: xoff}, {bmid: xlim}
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+    cost = 0
+    while True:
+        cost += 1
+
+        # Extend the forward search by one edit step in each diagonal
+        if fmin > dmin:
+            fmin -= 1
+            fd[fmin - 1] = -1
+        else:
+            fmin += 1
+        if fmax < dmax:
+            fmax += 1
+            fd[fmax + 1] = -1
+        else:
+            fmax -= 1
+        for d in range(fmax, fmin - 1, -2):
+            tlo, thi = fd[d - 1], fd[d + 1]
+            x = thi if tlo < thi else tlo + 1
+            y = x - d
+            if x < xlim and y < ylim and a[x] == b[y]:
+                x += _match_forward(a, b, x, y, min(xlim - x, ylim - y))
+            fd[d] = x
+            if odd and bmin <= d <= bmax and bd[d] <= x:
+                return x, x - d
+
+        # Similarly extend the backward search
+        if bmin > dmin:
+            bmin -= 1
+            bd[bmin - 1] = sys.maxsize
+        else:
+            bmin += 1
+        if bmax < dmax:
+            bmax += 1
+            bd[bmax + 1] = sys.maxsize
+        else:
+            bmax -= 1
+        for d in range(bmax, bmin - 1, -2):
+            tlo, thi = bd[d - 1], bd[d + 1]
+            x = tlo if tlo < thi else thi - 1
+            y = x - d
+            if x > xoff and y > yoff and a[x - 1] == b[y - 1]:
+                x -= _match_backward(a, b, x, y, min(x - xoff, y - yoff))
+            bd[d] = x
+            if not odd and fmin <= d <= fmax and x <= fd[d]:
+                return x, x - d
+
+        if cost >= max_cost:
+            fxybest = fxbest = -1
+            for d in range(fmax, fmin - 1, -2):
+                x = min(fd[d], xlim)
+                y = x - d
+                if ylim < y:
+                    x, y = ylim + d, ylim
+                if fxybest < x + y:
+                    fxybest, fxbest = x + y, x
+            bxybest, bxbest = sys.maxsize, -1
+            for d in range(bmax, bmin - 1, -2):
+                x = max(xoff, bd[d])
+                y = x - d
+                if y < yoff:
+                    x, y = yoff + d, yoff
+                if x + y < bxybest:
+                    bxybest, bxbest = x + y, x
+            if (xlim + ylim) - bxybest < fxybest - (xoff + yoff):
+                return fxbest, fxybest - fxbest
+            return bxbest, bxybest - bxbest
+
+
+def _unique_anchors(a, b, xoff, xlim, yoff, ylim):
+    """longest increasing run of (i, j) pairs of tokens that occur once in both ranges"""
+    once_a = {}
+    for i in range(xoff, xlim):
+        once_a[a[i]] = i if a[i] not in once_a else -1
+    once_b = {}
+    for j in range(yoff, ylim):
+        if once_a.get(b[j], -1) >= 0:
+            once_b[b[j]] = j if b[j] not in once_b else -1
+    pairs = [(once_a[t], j) for t, j in once_b.items() if j >= 0]
+    pairs.sort(key=lambda p: p[1])
+
+    # Patience sorting to find the longest increasing subsequence
+    tails, tails_idx, prev = [], [], []
+    for n, (i, _) in enumerate(pairs):
+        k = bisect.bisect_left(tails, i)
+        if k == len(tails):
+            tails.append(i)
+            tails_idx.append(n)
+        else:
+            tails[k], tails_idx[k] = i, n
+        prev.append(tails_idx[k - 1] if k else None)
+    anchors = []
+    n = tails_idx[-1] if tails_idx else None
+    while n is not None:
+        anchors.append(pairs[n])
+        n = prev[n]
+    return anchors[::-1]
+
+
+def _token_opcodes(a, b, max_cost):
+    """(i1, i2, j1, j2) blocks that differ between token lists a and b, in order"""
+    opcodes = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        xoff, xlim, yoff, ylim = stack.pop()
+        k = _match_forward(a, b, xoff, yoff, min(xlim - xoff, ylim - yoff))
+        xoff, yoff = xoff + k, yoff + k
+        k = _match_backward(a, b, xlim, ylim, min(xlim - xoff, ylim - yoff))
+        xlim, ylim = xlim - k, ylim - k
+        if xoff == xlim or yoff == ylim:
+            if xoff != xlim or yoff != ylim:
+                opcodes.append((xoff, xlim, yoff, ylim))
+            continue
+
+        # Tokens that are unique on both sides split big inputs cheaply (as in patience diff)
+        anchors = _unique_anchors(a, b, xoff, xlim, yoff, ylim)
+        if anchors:
+            starts = [(xoff, yoff)] + [(i + 1, j + 1) for i, j in anchors]
+            ends = anchors + [(xlim, ylim)]
+            stack.extend((x1, x2, y1, y2) for (x1, y1), (x2, y2) in reversed(list(zip(starts, ends))))
+            continue
+
+        # Without anchors a large block is most likely a rewrite, don't bother diffing it
+        if (xlim - xoff) + (ylim - yoff) > 4 * max_cost:
+            opcodes.append((xoff, xlim, yoff, ylim))
+            continue
+        xmid, ymid = _myers_split(a, b, xoff, xlim, yoff, ylim, max_cost)
+        if (xmid, ymid) in ((xoff, yoff), (xlim, ylim)):
+            opcodes.append((xoff, xlim, yoff, ylim))
+            continue
+        stack.append((xmid, xlim, ymid, ylim))
+        stack.append((xoff, xmid, yoff, ymid))
+
+    # Merge adjacent blocks (i.e: a deletion directly followed by an insertion)
+    merged = []
+    for i1, i2, j1, j2 in opcodes:
+        if merged and merged[-1][1] == i1 and merged[-1][3] == j1:
+            merged[-1] = (merged[-1][0], i2, merged[-1][2], j2)
+        else:
+            merged.append((i1, i2, j1, j2))
+    return merged
+
+
+def _myers_opcodes(a, b, max_cost=64, min_gap=8):
+    """
+    Linear-ish time diff of two strings, returned as (i1, i2, j1, j2) blocks that differ.
+
+    The common prefix and suffix are trimmed, the rest is tokenized and diffed with Myers'
+    O(ND) algorithm (bounded by max_cost) on tokens, using unique tokens as anchors.
+    Changed token blocks are then narrowed down to characters, and blocks that are less than
+    min_gap characters apart are merged as each block has some overhead in the patch.
+    """
+    n = min(len(a), len(b))
+    lo = _match_forward(a, b, 0, 0, n)
+    hi = _match_backward(a, b, len(a), len(b), n - lo)
+    tokens_a = _TOKENS.findall(a, lo, len(a) - hi)
+    tokens_b = _TOKENS.findall(b, lo, len(b) - hi)
+    ids = {}
+    ids_a = [ids.setdefault(t, len(ids)) for t in tokens_a]
+    ids_b = [ids.setdefault(t, len(ids)) for t in tokens_b]
+    offsets_a = list(accumulate(map(len, tokens_a), initial=lo))
+    offsets_b = list(accumulate(map(len, tokens_b), initial=lo))
+
+    opcodes = []
+    for t1, t2, u1, u2 in _token_opcodes(ids_a, ids_b, max_cost):
+        i1, i2, j1, j2 = offsets_a[t1], offsets_a[t2], offsets_b[u1], offsets_b[u2]
+        k = _match_forward(a, b, i1, j1, min(i2 - i1, j2 - j1))
+        i1, j1 = i1 + k, j1 + k
+        k = _match_backward(a, b, i2, j2, min(i2 - i1, j2 - j1))
+        i2, j2 = i2 - k, j2 - k
+        if opcodes and i1 - opcodes[-1][1] < min_gap:
+            opcodes[-1] = (opcodes[-1][0], i2, opcodes[-1][2], j2)
+        elif i1 != i2 or j1 != j2:
+            opcodes.append((i1, i2, j1, j2))
+    return opcodes
+
+
+def _difflib_opcodes(a, b):
+    """difflib's SequenceMatcher blocks that differ, its worst case is quadratic"""
+    s = SequenceMatcher(None, a, b)
+    return [(i1, i2, j1, j2) for tag, i1, i2, j1, j2 in s.get_opcodes() if tag != 'equal']
+
+
+# Diff backends, any callable returning the (i1, i2, j1, j2) blocks that differ between
+# its two inputs, in increasing order, can be used instead. It needs to be picklable
+# (i.e: a module level function) to be used when diffing in parallel.
+DIFF_BACKENDS = {
+    'myers': _myers_opcodes,
+    'difflib': _difflib_opcodes,
+}
+
+
+def _diff_frames(frame1, frame2, backend='myers'):
+    """diff two frames, either base64-encoded without line-wraps or decoded"""
+    if not callable(backend):
+        backend = DIFF_BACKENDS[backend]
+    return [[i1, i2, frame2[j1:j2]] for i1, i2, j1, j2 in backend(frame1, frame2)]
+
+
+def _decode_frame(frame):
+    """decode a base64-encoded file to a binary string, i.e: one character per byte"""
+    return base64.b64decode(frame).decode('latin-1')
+
+
+# Process pool shared by all writers, created on first use
+_executor = None
+
+
+def _shared_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor()
+    return _executor
+
+
+def _diff_chunk(frames, backend='myers'):
+    """diffs between consecutive frames of a contiguous chunk of frames"""
+    return [_diff_frames(frame1, frame2, backend=backend) for frame1, frame2 in zip(frames, frames[1:])]
+
+
+def _frame_diffs(frames, parallel=False, backend='myers', executor=None, chunks=None):
+    """
+    diffs between consecutive frames, if parallel these are computed by the executor (by
+    default the shared process pool) in contiguous chunks of frames so that each frame is only
+    sent to a worker once (or twice, on a chunk boundary)
+    """
+    if not parallel or len(frames) <= 2:
+        return _diff_chunk(frames, backend=backend)
+    executor = executor or _shared_executor()
+    chunks = chunks or 4 * (os.cpu_count() or 1)
+    size = -(-(len(frames) - 1) // chunks)
+    results = executor.map(partial(_diff_chunk, backend=backend),
+                           [frames[i:i + size + 1] for i in range(0, len(frames) - 1, size)])
+    return [diff for chunk in results for diff in chunk]
+
+
+def _diff_size(diff):
+    return sum(len(data) for _, _, data in diff)
+
+
+def _checkpoint_due(i, diff, last, total, interval=None, threshold=None):
+    """whether frame i, reached by diff, is a checkpoint given the last one and the size of the diffs since"""
+    return bool(interval and i - last >= interval) or \
+        (threshold is not None and total + _diff_size(diff) > threshold)
+
+
+def _select_checkpoints(diffs, interval=None, threshold=None):
+    """
+    Indices of the frames to embed in full: the first one, one every interval frames
+    and, if a threshold is given, any frame that would otherwise take more than threshold
+    bytes of diffs to reach from the previous checkpoint.
+    """
+    checkpoints, total = [0], 0
+    for i, diff in enumerate(diffs, start=1):
+        if _checkpoint_due(i, diff, checkpoints[-1], total, interval, threshold):
+            checkpoints.append(i)
+            total = 0
+        else:
+            total += _diff_size(diff)
+    return checkpoints
+
+
+def _reverse_diff(frame, diff):
+    """diff from the frame that diff produces back to frame"""
+    reverse, shift = [], 0
+    for low, high, data in diff:
+        reverse.append([low + shift, low + shift + len(data), frame[low:high]])
+        shift += len(data) - (high - low)
+    return reverse
+
+
+def _varints(numbers):
+    """LEB128 encoding of non-negative integers"""
+    out = bytearray()
+    for n in numbers:
+        while n >= 0x80:
+            out.append(n & 0x7f | 0x80)
+            n >>= 7
+        out.append(n)
+    return bytes(out)
+
+
+def _packed_diff_frames(diff_dict, binary=False, encoding='json'):
+    """javascript expression for an object mapping frames to diffs, packed in a single block
+    that's unpacked by the player, see unpackJSON and unpackVarint"""
+    if encoding == 'json':
+        if binary:
+            diff_dict = {i: [[low, high, base64.b64encode(data.encode('latin-1')).decode('ascii')]
+                             for low, high, data in diff] for i, diff in diff_dict.items()}
+        packed = {i: [x for op in diff for x in op] for i, diff in diff_dict.items()}
+        return 'unpackJSON({0}, {1})'.format(_js_string(json.dumps(packed, separators=(',', ':'))),
+                                             json.dumps(binary))
+    numbers, prev_frame = [], 0
+    for i, diff in diff_dict.items():
+        numbers += [i - prev_frame, len(diff)]
+        prev_frame, prev_high = i, 0
+        for low, high, data in diff:
+            numbers += [low - prev_high, high - low, len(data)]
+            prev_high = high
+    data = "".join(data for diff in diff_dict.values() for *_, data in diff)
+    return 'unpackVarint("{0}", {1})'.format(base64.b64encode(_varints(numbers)).decode('ascii'),
+                                             _js_string(data, binary))
+
+
+# Encodings of the embedded diffs, 'js' being a javascript statement per diff
+DIFF_ENCODINGS = ('js', 'json', 'varint')
+
+
+def _embedded_diff_frames(diff_dict, binary=False, name='diff_frames', encoding='js'):
+    """diff_dict maps the index of a frame to the diff from it to the next frame (or, for
+    reverse diffs, from the next frame back to it)"""
+    yield "\n"
+    if encoding != 'js':
+        yield '    Object.assign({0}, {1});\n'.format(name, _packed_diff_frames(diff_dict, binary, encoding))
+        return
+    template = '    ' + name + '[{0}] = [{1}]\n'
+    for i, frame_data in diff_dict.items():
+        yield template.format(i, ", ".join(f"[{low}, {high}, {_js_string(data, binary)}]"
+                                           for low, high, data in frame_data))
 
 
 class HTMLDiffWriter(HTMLWriter):
-    def __init__(self, *args, parallel=True, **kwargs):
+    """
+    Writer for JavaScript-based HTML movies that only embeds the first frame and the
+    diffs between consecutive frames.
+
+    Parameters
+    ----------
+    parallel : bool, default: True
+        Whether to diff frames in parallel, by default in a process pool shared by all
+        writers which is started the first time it is needed.
+
+    executor : `concurrent.futures.Executor`, optional
+        Executor to diff frames with when *parallel* instead of the shared process pool.
+
+    diff_backend : str or callable, default: 'myers'
+        One of the keys of ``DIFF_BACKENDS`` or a callable ``(a, b)`` returning the
+        ``(i1, i2, j1, j2)`` blocks that differ between two strings, in increasing order.
+        The 'difflib' backend is the original `difflib.SequenceMatcher` implementation.
+
+    decode_frames : bool, default: False
+        Diff the decoded files instead of their base64 encoding, which keeps the edits
+        aligned and the diffs much smaller (especially with the svg frame format). The
+        data URIs are then rebuilt by the browser.
+
+    checkpoint_interval : int, optional
+        Embed every *checkpoint_interval*-th frame in full, which bounds the number of
+        diffs to apply when seeking to that many. By default only the first frame is.
+
+    checkpoint_threshold : int, optional
+        Embed a frame in full whenever reaching it from the last full frame would take
+        more than *checkpoint_threshold* bytes of diffs. Can be combined with
+        *checkpoint_interval*.
+
+    reverse_diffs : bool, default: False
+        Also embed the diffs from each frame back to the previous one, so that stepping
+        or playing backwards costs as much as forwards instead of replaying from the last
+        checkpoint. These hold the data each diff replaces, about doubling the diffs' size.
+
+    cache_size : int, default: 2 ** 24
+        Size, in characters (i.e: bytes for base64 or binary frames), of the most recently
+        computed frames the player keeps around so that seeking starts from the closest
+        one. 0 disables the cache.
+
+    diff_encoding : {'js', 'json', 'varint'}, default: 'js'
+        How diffs are embedded: a javascript statement per diff, a single JSON document, or
+        base64-encoded varints for the offsets with the data of all diffs in one string.
+        'varint' is the most compact, especially with many small diffs, and the fastest to
+        initialize with binary frames, see the benchmarks.
+
+    stream : bool, default: False
+        Diff each frame against the previous one as it is grabbed, only keeping the diffs,
+        the checkpoints and the latest frame instead of every frame until `finish`. If
+        *parallel* too, the diffs are computed in the background (by *executor* or the
+        shared process pool) while the next frames are rendered.
+
+    compress : bool or int, default: False
+        Zlib-compress the embedded frames and diffs (at this level if an int), which the
+        player inflates with ``DecompressionStream``, or a javascript fallback where it is
+        unavailable, before showing the first frame. Compression runs in a background
+        thread, and with *stream* (and the 'js' *diff_encoding*) while frames are rendered.
+        Segment files are compressed too.
+
+    If *embed_frames* is False, each checkpoint and the diffs up to the next one are written
+    to a segment file in the frame directory (next to the html file by default) instead,
+    which the player loads when needed, prefetching the next segment during playback. A
+    checkpoint is then made every 100 frames unless *checkpoint_interval* or
+    *checkpoint_threshold* are given.
+
+    All other arguments are passed on to `~matplotlib.animation.HTMLWriter`.
+    """
+    def __init__(self, *args, parallel=True, executor=None, diff_backend='myers', decode_frames=False,
+                 checkpoint_interval=None, checkpoint_threshold=None, reverse_diffs=False,
+                 cache_size=2 ** 24, diff_encoding='js', stream=False, compress=False, **kwargs):
         self.parallel = parallel
+        self.executor = executor
+        self.decode_frames = decode_frames
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_threshold = checkpoint_threshold
+        self.reverse_diffs = reverse_diffs
+        self.cache_size = cache_size
+        self.stream = stream
+        self.compress = compress
+        if not callable(diff_backend) and diff_backend not in DIFF_BACKENDS:
+            raise ValueError(f"diff_backend must be callable or one of {list(DIFF_BACKENDS)}, "
+                             f"got {diff_backend!r}")
+        self.diff_backend = diff_backend
+        if diff_encoding not in DIFF_ENCODINGS:
+            raise ValueError(f"diff_encoding must be one of {list(DIFF_ENCODINGS)}, got {diff_encoding!r}")
+        self.diff_encoding = diff_encoding
         super().__init__(*args, **kwargs)
+        if not self.embed_frames and checkpoint_interval is None and checkpoint_threshold is None:
+            self.checkpoint_interval = 100
+
+    def _log_checkpoints(self, num_frames, checkpoint_frames, diff_dict):
+        # Report the size/latency tradeoff of the chosen checkpoints, the worst case
+        # being to seek to the frame right before a checkpoint.
+        checkpoints = sorted(checkpoint_frames)
+        ends = checkpoints[1:] + [num_frames]
+        seek_bytes = [sum(_diff_size(diff_dict[i]) for i in range(start, end - 1))
+                      for start, end in zip(checkpoints, ends)]
+        _log.info("HTMLDiffWriter: %d checkpoints (%s bytes) and %d diffs (%s bytes), seeking "
+                  "applies at most %d diffs (%s bytes)", len(checkpoints),
+                  sum(map(len, checkpoint_frames.values())), len(diff_dict),
+                  sum(map(_diff_size, diff_dict.values())),
+                  max(end - start - 1 for start, end in zip(checkpoints, ends)), max(seek_bytes))
+
+    def _prepare_frame(self, frame):
+        if self.decode_frames:
+            return _decode_frame(frame)
+        # Ignore line-wraps as per RFC 4648
+        return _add_base64_prefix([frame.replace('\n', '')], self.frame_format)[0]
+
+    def _frame_encoding(self):
+        # The prefix of the data URIs the player adds and whether embedded frames are binary
+        if self.decode_frames:
+            # Svg files are text and are embedded as such, other formats as base64
+            return _add_base64_prefix([''], self.frame_format)[0], self.frame_format != 'svg'
+        return '', False
+
+    def _compressor(self):
+        return _Compressor(-1 if self.compress is True else self.compress)
+
+    def setup(self, fig, outfile, dpi=None, frame_dir=None):
+        super().setup(fig, outfile, dpi=dpi, frame_dir=frame_dir)
+        # Streaming state, diffs are pending until their checkpoint status is known
+        self._last_frame = None
+        self._pending = deque()
+        self._diffs = []
+        self._reverse = []
+        self._checkpoint_frames = {}
+        self._last_checkpoint, self._diff_total = 0, 0
+        # Frames and diffs are compressed as soon as they are known when streaming
+        self._streamed = None
+        if self.compress and self.stream and self.embed_frames and self.diff_encoding == 'js':
+            self._streamed = self._compressor()
+
+    def _read_frame(self, path):
+        # Frame written by FileMovieWriter, base64-encoded like embedded ones
+        frame = base64.b64encode(path.read_bytes()).decode('ascii')
+        path.unlink()
+        return frame
+
+    def grab_frame(self, **savefig_kwargs):
+        super().grab_frame(**savefig_kwargs)
+        if self.stream and (self._temp_paths or self._saved_frames):
+            if self.embed_frames:
+                frame = self._prepare_frame(self._saved_frames.pop())
+            else:
+                frame = self._prepare_frame(self._read_frame(self._temp_paths.pop()))
+            if self._last_frame is None:
+                self._checkpoint_frames[0] = frame
+                self._stream_statements(_embedded_checkpoint_frames({0: frame}, self._frame_encoding()[1]))
+            elif self.parallel:
+                executor = self.executor or _shared_executor()
+                self._pending.append((self._last_frame, frame, executor.submit(
+                    _diff_frames, self._last_frame, frame, backend=self.diff_backend)))
+            else:
+                self._pending.append((self._last_frame, frame, _diff_frames(
+                    self._last_frame, frame, backend=self.diff_backend)))
+            self._last_frame = frame
+            self._collect_diffs()
+
+    def _collect_diffs(self, wait=False):
+        # Consume the diffs computed so far, in order, keeping only the checkpoint frames
+        while self._pending:
+            prev_frame, frame, diff = self._pending[0]
+            if not isinstance(diff, list):
+                if not (wait or diff.done()):
+                    break
+                diff = diff.result()
+            self._pending.popleft()
+            i = len(self._diffs) + 1
+            if _checkpoint_due(i, diff, self._last_checkpoint, self._diff_total,
+                               self.checkpoint_interval, self.checkpoint_threshold):
+                self._checkpoint_frames[i] = frame
+                self._last_checkpoint, self._diff_total = i, 0
+            else:
+                self._diff_total += _diff_size(diff)
+            self._diffs.append(diff)
+            binary = self._frame_encoding()[1]
+            if i in self._checkpoint_frames:
+                self._stream_statements(_embedded_checkpoint_frames({i: frame}, binary))
+            else:
+                self._stream_statements(_embedded_diff_frames({i - 1: diff}, binary))
+            if self.reverse_diffs:
+                self._reverse.append(_reverse_diff(prev_frame, diff))
+                self._stream_statements(_embedded_diff_frames({i - 1: self._reverse[-1]}, binary,
+                                                              name='reverse_frames'))
+
+    def _stream_statements(self, statements):
+        if self._streamed:
+            for statement in statements:
+                self._streamed.write(statement)
+
+    def _write_segments(self, anim_id, num_frames, checkpoint_frames, diff_dict, reverse, binary):
+        # One file per checkpoint with the diffs up to the next one, and the reverse diffs
+        # from its frames
+        frame_dir = Path(self.temp_prefix).parent
+        checkpoints = sorted(checkpoint_frames)
+        ends = checkpoints[1:] + [num_frames]
+        for segment, (start, end) in enumerate(zip(checkpoints, ends)):
+            chunks = dict(
+                fill_frames=_embedded_checkpoint_frames({start: checkpoint_frames[start]}, binary=binary),
+                diff_frames=_embedded_diff_frames({i: diff_dict[i] for i in range(start, end - 1)},
+                                                  binary=binary, encoding=self.diff_encoding),
+                reverse_frames=_embedded_diff_frames(
+                    {i: reverse[i] for i in range(max(start - 1, 0), end - 1) if reverse},
+                    binary=binary, name='reverse_frames', encoding=self.diff_encoding),
+                compressed=['null'])
+            if self.compress:
+                chunks = dict(fill_frames=(), diff_frames=(), reverse_frames=(),
+                              compressed=_compressed_frames(self._compressor(), *chunks.values()))
+            with open(Path(frame_dir, f'segment{segment}.js'), 'w') as of:
+                _write_template(of, SEGMENT_TEMPLATE, chunks, id=anim_id, segment=segment)
+        return json.dumps(checkpoints), Path(os.path.relpath(frame_dir, Path(self.outfile).parent)).as_posix()
 
     def finish(self):
         # save the frames to an html file
+        frame_prefix, binary = self._frame_encoding()
+        if self.stream:
+            self._collect_diffs(wait=True)
+            diffs, checkpoint_frames, reverse = self._diffs, self._checkpoint_frames, self._reverse
+        else:
+            if self.embed_frames:
+                frames = [self._prepare_frame(frame) for frame in self._saved_frames]
+            else:
+                frames = [self._prepare_frame(self._read_frame(path)) for path in self._temp_paths]
+                self._temp_paths = []
+            diffs = _frame_diffs(frames, parallel=self.parallel, backend=self.diff_backend,
+                                 executor=self.executor)
+            checkpoints = _select_checkpoints(diffs, interval=self.checkpoint_interval,
+                                              threshold=self.checkpoint_threshold)
+            checkpoint_frames = {i: frames[i] for i in checkpoints}
+            reverse = [_reverse_diff(frames[i], diff) for i, diff in enumerate(diffs)] \
+                if self.reverse_diffs else []
+        # Checkpointed frames are never reached by applying a diff
+        diff_dict = {i: diff for i, diff in enumerate(diffs) if i + 1 not in checkpoint_frames}
+        self._log_checkpoints(len(diffs) + 1, checkpoint_frames, diff_dict)
+        Ndiffs = len(diffs)
+        anim_id = uuid.uuid4().hex
+
         if self.embed_frames:
-            # Ignore line-wraps as per RFC 4648
-            prefixed_frames = [frame.replace('\n', '') for frame in self._saved_frames]
-            prefixed_frames = _add_base64_prefix(prefixed_frames, self.frame_format)
-            fill_frames = _embedded_checkpoint_frames({0: prefixed_frames[0]})
-            diff_frames = _embedded_diff_frames(prefixed_frames, parallel=self.parallel)
-            Ndiffs = len(self._saved_frames) - 1
+            fill_frames = _embedded_checkpoint_frames(checkpoint_frames, binary=binary)
+            diff_frames = _embedded_diff_frames(diff_dict, binary=binary, encoding=self.diff_encoding)
+            reverse_frames = ()
+            if self.reverse_diffs:
+                reverse_frames = _embedded_diff_frames(dict(enumerate(reverse)), binary=binary,
+                                                       name='reverse_frames', encoding=self.diff_encoding)
+            segments, segment_dir = 'null', ''
+            compressed = ['null']
+            if self._streamed:
+                fill_frames = diff_frames = reverse_frames = ()
+                compressed = _compressed_frames(self._streamed)
+            elif self.compress:
+                compressed = _compressed_frames(self._compressor(), fill_frames, diff_frames, reverse_frames)
+                fill_frames = diff_frames = reverse_frames = ()
         else:
-            raise NotImplementedError('Only embedded frames are supported at the moment')
+            fill_frames = diff_frames = reverse_frames = ()
+            compressed = ['null']
+            segments, segment_dir = self._write_segments(anim_id, Ndiffs + 1, checkpoint_frames,
+                                                         diff_dict, reverse, binary)
 
         mode_dict = dict(once_checked='',
                          loop_checked='',
@@ -359,14 +1404,22 @@ class HTMLDiffWriter(HTMLWriter):
 
         interval = 1000 // self.fps
 
+        # Frames are written one at a time so that the document is never held in memory
         with open(self.outfile, 'w') as of:
             of.write(JS_INCLUDE + STYLE_INCLUDE)
-            of.write(DISPLAY_TEMPLATE.format(id=uuid.uuid4().hex,
-                                             Ndiffs=Ndiffs,
-                                             fill_frames=fill_frames,
-                                             diff_frames=diff_frames,
-                                             interval=interval,
-                                             **mode_dict))
+            _write_template(of, DISPLAY_TEMPLATE,
+                            dict(fill_frames=fill_frames,
+                                 diff_frames=diff_frames,
+                                 reverse_frames=reverse_frames,
+                                 compressed=compressed),
+                            id=anim_id,
+                            Ndiffs=Ndiffs,
+                            frame_prefix=frame_prefix,
+                            segments=segments,
+                            segment_dir=segment_dir,
+                            interval=interval,
+                            cache_size=self.cache_size,
+                            **mode_dict)
 
         # duplicate the temporary file clean up logic from
         # FileMovieWriter.cleanup.  We can not call the inherited
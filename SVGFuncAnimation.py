@@ -1,12 +1,16 @@
+import re
+import json
+import zlib
+import base64
+import hashlib
 import itertools
 import logging
-import uuid
 from pathlib import Path
-from html import unescape
-from xml.dom import minidom
+from xml.parsers import expat
 from functools import lru_cache
 from tempfile import TemporaryDirectory
 from io import StringIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import numpy as np
 import matplotlib as mpl
@@ -28,8 +32,20 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
     return ua.indexOf("MSIE ") > -1 || ua.indexOf("Trident/") > -1;
   }
 
+  /* Call back on the next animation frame, or after a timeout where there are none */
+  function requestFrame(callback) {
+    if (typeof requestAnimationFrame !== "undefined") return requestAnimationFrame(callback);
+    return setTimeout(function() { callback(performance.now()); }, 16);
+  }
+
+  function cancelFrame(handle) {
+    if (typeof cancelAnimationFrame !== "undefined") cancelAnimationFrame(handle);
+    else clearTimeout(handle);
+  }
+
   /* Define the Animation class */
-  function Animation(frames, doc_id, slider_id, interval, loop_select_id){
+  function Animation(frames, fragments, keyframes, chunks, length, doc_id, slider_id, interval,
+                     loop_select_id, stats_id){
     this.doc_id = doc_id;
     this.slider_id = slider_id;
     this.loop_select_id = loop_select_id;
@@ -37,10 +53,32 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
     this.current_frame = 0;
     this.direction = 0;
     this.timer = null;
+    this.stats = {fps: 0, shown: 0, dropped: 0};
+    this.stats_id = stats_id;
+    this.fps_start = null;
+    this.fps_frames = 0;
     this.frames = frames;
+    this.fragments = fragments;
+    // Ids of the json script elements holding the frames not parsed yet, in order
+    this.chunks = chunks;
+    this.parsed_chunks = 0;
+    this.last_chunk_start = 0;
+    this.length = length;
+    // Last fragment computed for each artist, as [frame, fragment], to patch
+    this.artist_fragments = {};
+    // Latest fragment of every artist drawn so far, at every keyframe
+    this.keyframes = keyframes;
+    this.keyframe_indices = Object.keys(keyframes).map(Number).sort(function(a, b) { return a - b; });
+    // Fragments shown, and the original ones, of the artists changed so far
+    this.shown = {};
+    this.base_fragments = {};
+    this.shown_frame = -1;
+    // Elements of the artists, and their descendants in document order, by id
+    this.elements = {};
+    this.descendants = {};
 
     var slider = document.getElementById(this.slider_id);
-    slider.max = this.frames.length - 1;
+    slider.max = this.length - 1;
     if (isInternetExplorer()) {
         // switch from oninput to onchange because IE <= 11 does not conform
         // with W3C specification. It ignores oninput and onchange behaves
@@ -62,17 +100,148 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
     return undefined;
   }
 
+  Animation.prototype.get_fragment = function(frame, id){
+    // Entries are fragment indices or patches of the artist's previous fragment, walk
+    // back to a full fragment (the last one computed or a keyframe's) and patch it forward
+    var patches = [], base;
+    for (var k = frame; base === undefined; k--) {
+        var entry = this.frames[k][id], cached = this.artist_fragments[id], keyframe = this.keyframes[k];
+        if (cached && cached[0] === k) {
+            base = cached[1];
+        } else if (keyframe && id in keyframe) {
+            base = this.fragments[keyframe[id]];
+        } else if (typeof entry === "number") {
+            base = this.fragments[entry];
+        } else if (entry !== undefined) {
+            patches.push(entry);
+        }
+    }
+    while (patches.length) {
+        var patch = patches.pop();
+        base = isAttributeDelta(patch) ? applyAttributes(base, patch) : applyPatch(base, patch);
+    }
+    this.artist_fragments[id] = [frame, base];
+    return base;
+  }
+
+  Animation.prototype.parse_frames = function(frame){
+    // Parse the chunks up to the one holding frame, in order as their entries refer to
+    // the fragments of those before
+    while (this.frames.length <= frame && this.parsed_chunks < this.chunks.length) {
+        var element = document.getElementById(this.chunks[this.parsed_chunks++]);
+        this.last_chunk_start = this.frames.length;
+        addEntries(JSON.parse(element.textContent), this.frames, this.fragments, this.keyframes);
+        element.textContent = "";
+    }
+    this.keyframe_indices = Object.keys(this.keyframes).map(Number).sort(function(a, b) { return a - b; });
+    this.parsing = false;
+  }
+
+  Animation.prototype.keyframe_before = function(frame){
+    var low = 0, high = this.keyframe_indices.length;
+    while (low < high) {
+        var mid = (low + high) >> 1;
+        if (this.keyframe_indices[mid] <= frame) low = mid + 1;
+        else high = mid;
+    }
+    return low ? this.keyframe_indices[low - 1] : -1;
+  }
+
   Animation.prototype.set_frame = function(frame){
     this.current_frame = frame;
-    for (var id of Object.keys(this.frames[frame])) {
-        document.getElementById(id).outerHTML = this.frames[frame][id];
+    this.parse_frames(frame);
+    if (!this.parsing && this.parsed_chunks < this.chunks.length && frame >= this.last_chunk_start) {
+        // Parse the next chunk ahead of playback, once it reaches the last one parsed
+        var t = this;
+        this.parsing = true;
+        setTimeout(function() { t.parse_frames(t.frames.length); }, 0);
+    }
+    var updates = {}, deltas = {}, id, keyframe = this.keyframe_before(frame);
+    if (frame > this.shown_frame && (frame === this.shown_frame + 1 || this.shown_frame >= keyframe)) {
+        // Only the artists drawn since the frame shown change, to their latest fragment, or
+        // by setting their attributes if that's all these frames did
+        var drawn = {};
+        for (var i = this.shown_frame + 1; i <= frame; i++) {
+            for (id in this.frames[i]) {
+                var entry = this.frames[i][id];
+                if (isAttributeDelta(entry) && (!(id in drawn) || id in deltas)) {
+                    deltas[id] = mergeAttributes(deltas[id] || {}, entry);
+                } else {
+                    delete deltas[id];
+                }
+                drawn[id] = i;
+            }
+        }
+        for (id in drawn) updates[id] = this.get_fragment(drawn[id], id);
+    } else {
+        // Every artist as of the nearest keyframe, updated by the frames since, and
+        // the original fragment of those not drawn yet
+        var latest = {};
+        for (var i = frame; i > keyframe; i--) {
+            for (id in this.frames[i]) if (!(id in latest)) latest[id] = i;
+        }
+        for (id in this.shown) updates[id] = this.base_fragments[id];
+        for (id in this.keyframes[keyframe]) updates[id] = this.fragments[this.keyframes[keyframe][id]];
+        for (id in latest) updates[id] = this.get_fragment(latest[id], id);
+    }
+    var replaced = [], html = "";
+    for (id in updates) {
+        if (this.shown[id] === updates[id]) continue;
+        if (!(id in this.base_fragments)) this.base_fragments[id] = this.element(id).outerHTML;
+        this.shown[id] = updates[id];
+        if (id in deltas) {
+            this.set_attributes(id, deltas[id]);
+        } else {
+            replaced.push(id);
+            html += updates[id];
+        }
     }
+    if (replaced.length) this.replace_elements(replaced, html);
+    this.shown_frame = frame;
     document.getElementById(this.slider_id).value = this.current_frame;
   }
 
+  Animation.prototype.element = function(id){
+    // Elements are looked up once, and again once replaced
+    return this.elements[id] || (this.elements[id] = document.getElementById(id));
+  }
+
+  Animation.prototype.set_attributes = function(id, delta){
+    var nodes = this.descendants[id];
+    if (!nodes) {
+        var element = this.element(id);
+        nodes = this.descendants[id] = [element].concat(
+            Array.prototype.slice.call(element.getElementsByTagName("*")));
+    }
+    for (var k in delta) {
+        for (var name in delta[k]) {
+            var value = unescapeXML(delta[k][name]);
+            if (name.indexOf("xlink:") === 0) {
+                nodes[k].setAttributeNS("http://www.w3.org/1999/xlink", name, value);
+            } else {
+                nodes[k].setAttribute(name, value);
+            }
+        }
+    }
+  }
+
+  Animation.prototype.replace_elements = function(ids, html){
+    // Parse the fragments of all the artists replaced at once (within an svg element, for
+    // them to be svg), rather than each by setting its outerHTML, then swap them in
+    var container = document.createElementNS("http://www.w3.org/2000/svg", "svg");
+    container.innerHTML = html;
+    var nodes = Array.prototype.slice.call(container.children);
+    for (var k = 0; k < ids.length; k++) {
+        var element = this.element(ids[k]);
+        element.parentNode.replaceChild(nodes[k], element);
+        this.elements[ids[k]] = nodes[k];
+        delete this.descendants[ids[k]];
+    }
+  }
+
   Animation.prototype.next_frame = function()
   {
-    this.set_frame(Math.min(this.frames.length - 1, this.current_frame + 1));
+    this.set_frame(Math.min(this.length - 1, this.current_frame + 1));
   }
 
   Animation.prototype.previous_frame = function()
@@ -87,7 +256,7 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
 
   Animation.prototype.last_frame = function()
   {
-    this.set_frame(this.frames.length - 1);
+    this.set_frame(this.length - 1);
   }
 
   Animation.prototype.slower = function()
@@ -104,10 +273,10 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
     else if(this.direction < 0){this.reverse_animation();}
   }
 
-  Animation.prototype.anim_step_forward = function()
+  Animation.prototype.anim_step_forward = function(steps)
   {
-    this.current_frame += 1;
-    if(this.current_frame < this.frames.length){
+    this.current_frame += steps || 1;
+    if(this.current_frame < this.length){
       this.set_frame(this.current_frame);
     }else{
       var loop_state = this.get_loop_state();
@@ -123,9 +292,9 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
     }
   }
 
-  Animation.prototype.anim_step_reverse = function()
+  Animation.prototype.anim_step_reverse = function(steps)
   {
-    this.current_frame -= 1;
+    this.current_frame -= steps || 1;
     if(this.current_frame >= 0){
       this.set_frame(this.current_frame);
     }else{
@@ -146,7 +315,7 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
   {
     this.direction = 0;
     if (this.timer){
-      clearInterval(this.timer);
+      cancelFrame(this.timer);
       this.timer = null;
     }
   }
@@ -155,20 +324,263 @@ href="https://maxcdn.bootstrapcdn.com/font-awesome/4.4.0/css/font-awesome.min.cs
   {
     this.pause_animation();
     this.direction = 1;
-    var t = this;
-    if (!this.timer) this.timer = setInterval(function() {
-        t.anim_step_forward();
-    }, this.interval);
+    this.schedule_steps();
   }
 
   Animation.prototype.reverse_animation = function()
   {
     this.pause_animation();
     this.direction = -1;
-    var t = this;
-    if (!this.timer) this.timer = setInterval(function() {
-        t.anim_step_reverse();
-    }, this.interval);
+    this.schedule_steps();
+  }
+
+  Animation.prototype.schedule_steps = function()
+  {
+    // Step on animation frames by as many frames as intervals have passed, so that
+    // frames are dropped rather than piling up when they take longer than the interval
+    var t = this, last = null;
+    this.fps_start = null;
+    function tick(now) {
+      t.timer = requestFrame(tick);
+      if (last === null) last = now;
+      var steps = Math.floor((now - last) / t.interval);
+      if (steps < 1) return;
+      last += steps * t.interval;
+      t.count_frame(now, steps - 1);
+      if (t.direction > 0) t.anim_step_forward(steps);
+      else t.anim_step_reverse(steps);
+    }
+    this.timer = requestFrame(tick);
+  }
+
+  Animation.prototype.count_frame = function(now, dropped)
+  {
+    // Frames shown and dropped while playing, and the frame rate over the last half second
+    this.stats.shown += 1;
+    this.stats.dropped += dropped;
+    if (this.fps_start === null || now - this.fps_start >= 500) {
+      if (this.fps_start !== null) {
+        this.stats.fps = this.fps_frames * 1000 / (now - this.fps_start);
+        document.getElementById(this.stats_id).textContent =
+            this.stats.fps.toFixed(1) + " fps, " + this.stats.dropped + " dropped";
+      }
+      this.fps_start = now;
+      this.fps_frames = 0;
+    }
+    this.fps_frames += 1;
+  }
+
+  /**
+  * Decode base64 into bytes
+  * @param {string} b64
+  */
+  function decodeBase64(b64) {
+    let binary = atob(b64), bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+    return bytes;
+  }
+
+  /**
+  * Minimal DEFLATE (RFC 1951) decoder, for browsers without DecompressionStream
+  * @param {Uint8Array} data
+  */
+  function inflateRaw(data) {
+    const LBASE = [3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31, 35, 43, 51, 59, 67, 83, 99,
+                   115, 131, 163, 195, 227, 258];
+    const LEXT = [0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5, 5, 0];
+    const DBASE = [1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193, 257, 385, 513, 769, 1025,
+                   1537, 2049, 3073, 4097, 6145, 8193, 12289, 16385, 24577];
+    const DEXT = [0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 8, 8, 9, 9, 10, 10, 11, 11, 12,
+                  12, 13, 13];
+    const ORDER = [16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15];
+    let out = new Uint8Array(Math.max(4 * data.length, 1024)), len = 0;
+    let pos = 0, bitbuf = 0, bitcnt = 0;
+    function bits(n) {
+      while (bitcnt < n) {
+        bitbuf |= data[pos++] << bitcnt;
+        bitcnt += 8;
+      }
+      let value = bitbuf & ((1 << n) - 1);
+      bitbuf >>>= n;
+      bitcnt -= n;
+      return value;
+    }
+    function put(byte) {
+      if (len === out.length) {
+        let grown = new Uint8Array(2 * len);
+        grown.set(out);
+        out = grown;
+      }
+      out[len++] = byte;
+    }
+    // Canonical huffman code, as the number of codes of each length and the symbols in code order
+    function huffman(lengths) {
+      let counts = new Uint16Array(16), offsets = new Uint16Array(16), symbols = new Uint16Array(lengths.length);
+      for (let i = 0; i < lengths.length; i++) counts[lengths[i]]++;
+      counts[0] = 0;
+      for (let i = 1; i < 16; i++) offsets[i] = offsets[i - 1] + counts[i - 1];
+      for (let i = 0; i < lengths.length; i++) if (lengths[i]) symbols[offsets[lengths[i]]++] = i;
+      return {counts: counts, symbols: symbols};
+    }
+    function decode(code) {
+      for (let length = 1, value = 0, first = 0, index = 0; length < 16; length++) {
+        value |= bits(1);
+        let count = code.counts[length];
+        if (value - first < count) return code.symbols[index + value - first];
+        index += count;
+        first = (first + count) << 1;
+        value <<= 1;
+      }
+      throw new Error("invalid deflate data");
+    }
+    let last;
+    do {
+      last = bits(1);
+      let type = bits(2);
+      if (type === 0) {
+        // Stored block, starting at the next byte
+        bitbuf = bitcnt = 0;
+        let n = data[pos] | data[pos + 1] << 8;
+        pos += 4;
+        for (let end = pos + n; pos < end; ) put(data[pos++]);
+        continue;
+      }
+      let lit, dist;
+      if (type === 1) {
+        let lengths = new Uint8Array(288);
+        lengths.fill(8, 0, 144).fill(9, 144, 256).fill(7, 256, 280).fill(8, 280);
+        lit = huffman(lengths);
+        dist = huffman(new Uint8Array(30).fill(5));
+      } else {
+        let nlen = bits(5) + 257, ndist = bits(5) + 1, ncode = bits(4) + 4;
+        let lengths = new Uint8Array(19);
+        for (let i = 0; i < ncode; i++) lengths[ORDER[i]] = bits(3);
+        let code = huffman(lengths);
+        lengths = new Uint8Array(nlen + ndist);
+        for (let i = 0; i < nlen + ndist; ) {
+          let symbol = decode(code);
+          if (symbol < 16) {
+            lengths[i++] = symbol;
+          } else {
+            let repeat, value = 0;
+            if (symbol === 16) {
+              value = lengths[i - 1];
+              repeat = 3 + bits(2);
+            } else {
+              repeat = symbol === 17 ? 3 + bits(3) : 11 + bits(7);
+            }
+            while (repeat--) lengths[i++] = value;
+          }
+        }
+        lit = huffman(lengths.subarray(0, nlen));
+        dist = huffman(lengths.subarray(nlen));
+      }
+      for (let symbol = decode(lit); symbol !== 256; symbol = decode(lit)) {
+        if (symbol < 256) {
+          put(symbol);
+        } else {
+          symbol -= 257;
+          let length = LBASE[symbol] + bits(LEXT[symbol]);
+          symbol = decode(dist);
+          let distance = DBASE[symbol] + bits(DEXT[symbol]);
+          for (let i = 0; i < length; i++) put(out[len - distance]);
+        }
+      }
+    } while (!last);
+    return out.subarray(0, len);
+  }
+
+  /**
+  * Apply the diff patch to the input string. The patch's [low, high, data]
+  * operations replace base.slice(low, high) with data, they must be sorted by
+  * offset and not overlap.
+  * @param {string} base
+  * @param {Array<Array<>>} patch
+  */
+  function applyPatch(base, patch) {
+    let target = '', pos = 0;
+    for (let [low, high, data] of patch) {
+      target += base.slice(pos, low) + data;
+      pos = high;
+    }
+    return target + base.slice(pos);
+  }
+
+  /**
+  * Set the attributes of an attribute delta, {element: {name: value}} with elements
+  * numbered in document order, in the input string's start tags.
+  * @param {string} base
+  * @param {Object} delta
+  */
+  function applyAttributes(base, delta) {
+    let element = 0;
+    return base.replace(/<[\\w:.-]+(?:\\s+[\\w:.-]+="[^"]*")*\\s*\\/?>/g, function(tag) {
+      let changed = delta[element++];
+      if (!changed) return tag;
+      return tag.replace(/(\\s+)([\\w:.-]+)="[^"]*"/g, function(attribute, space, name) {
+        return name in changed ? space + name + '="' + changed[name] + '"' : attribute;
+      });
+    });
+  }
+
+  /* Frame entries are fragment indices, patches, or attribute deltas */
+  function isAttributeDelta(entry) {
+    return typeof entry === "object" && !Array.isArray(entry);
+  }
+
+  function mergeAttributes(target, delta) {
+    for (var element in delta) {
+        target[element] = target[element] || {};
+        for (var name in delta[element]) target[element][name] = delta[element][name];
+    }
+    return target;
+  }
+
+  function unescapeXML(value) {
+    var entities = {amp: "&", apos: "'", quot: '"', lt: "<", gt: ">"};
+    return value.replace(/&(amp|apos|quot|lt|gt);/g, function(_, name) { return entities[name]; });
+  }
+
+  /**
+  * Split the compressed frames into the frames, the fragments they refer to, which
+  * precede them, and the [frame, keyframe] pairs
+  * @param {string} b64
+  */
+  function inflateFrames(b64) {
+    return inflate(b64).then(function(text) {
+      var frames = [], fragments = [], keyframes = {};
+      addEntries(JSON.parse(text), frames, fragments, keyframes);
+      return [frames, fragments, keyframes];
+    });
+  }
+
+  /**
+  * Add entries, fragments (strings), keyframes ([frame, keyframe]) and frames, in order
+  */
+  function addEntries(entries, frames, fragments, keyframes) {
+    for (var entry of entries) {
+      if (typeof entry === "string") fragments.push(entry);
+      else if (Array.isArray(entry)) keyframes[entry[0]] = entry[1];
+      else frames.push(entry);
+    }
+  }
+
+  /**
+  * Inflate base64 zlib data into a string, with DecompressionStream where available
+  * @param {string} b64
+  */
+  function inflate(b64) {
+    let bytes = decodeBase64(b64);
+    if (typeof DecompressionStream !== "undefined") {
+      let stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("deflate"));
+      return new Response(stream).text();
+    }
+    // Skip the zlib header, the payload is ascii
+    let data = inflateRaw(bytes.subarray(2)), text = "";
+    for (let i = 0; i < data.length; i += 0x8000) {
+      text += String.fromCharCode.apply(null, data.subarray(i, i + 0x8000));
+    }
+    return Promise.resolve(text);
   }
 </script>
 """
@@ -200,6 +612,10 @@ input[type=range].anim-slider {
     margin: 0;
     vertical-align: middle;
 }
+.anim-stats {
+    font-size: small;
+    opacity: 0.6;
+}
 </style>
 """
 
@@ -244,9 +660,10 @@ DISPLAY_TEMPLATE = """
              {reflect_checked}>
       <label for="_anim_radio3_{id}">Reflect</label>
     </form>
+    <div id="_anim_stats{id}" class="anim-stats"></div>
   </div>
 </div>
-
+{frame_chunks}
 
 <script language="javascript">
   /* Instantiate the Animation class. */
@@ -255,19 +672,264 @@ DISPLAY_TEMPLATE = """
     var doc_id = "_anim_doc{id}";
     var slider_id = "_anim_slider{id}";
     var loop_select_id = "_anim_loop_select{id}";
+    var stats_id = "_anim_stats{id}";
+    var fragments = {fragments};
+    var keyframes = {keyframes};
     var frames = {fill_frames};
+    /* or parsed from these script elements as needed */
+    var chunks = {chunk_ids};
+    /* compressed frames are inflated asynchronously */
+    var loading = {compressed};
 
     /* set a timeout to make sure all the above elements are created before
        the object is initialized. */
     setTimeout(function() {{
-        anim{id} = new Animation(frames, doc_id, slider_id, {interval},
-                                 loop_select_id);
+        Promise.resolve(loading).then(function(inflated) {{
+            inflated = inflated || [frames, fragments, keyframes];
+            anim{id} = new Animation(inflated[0], inflated[1], inflated[2], chunks, {Nframes},
+                                     doc_id, slider_id, {interval}, loop_select_id, stats_id);
+        }});
     }}, 0);
   }})()
 </script>
 """
 
 
+def _write_template(of, template, chunks, **kwargs):
+    """
+    Format template into the file of, the placeholders named in chunks being filled with
+    the strings their iterable yields, written as they are produced rather than joined.
+    """
+    pattern = '(' + '|'.join(re.escape('{' + name + '}') for name in chunks) + ')'
+    for part in re.split(pattern, template):
+        if part.startswith('{') and part[1:-1] in chunks:
+            for chunk in chunks[part[1:-1]]:
+                of.write(chunk)
+        else:
+            of.write(part.format(**kwargs))
+
+
+def _iter_array_js(items):
+    # Same as str(items), a javascript array of the frames (objects mapping gids to the
+    # index of their svg group) or of the fragments
+    yield "["
+    for i, item in enumerate(items):
+        yield (", " if i else "") + repr(item)
+    yield "]"
+
+
+class _Compressor:
+    """
+    Zlib-compresses the strings written to it in a background thread, in order, so that
+    compression overlaps with whatever produces them (zlib releases the GIL).
+    """
+    def __init__(self, level=-1):
+        self._compressor = zlib.compressobj(level)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(self._executor.submit(self._compressor.compress, data.encode('ascii')))
+
+    def getvalue(self):
+        self._chunks.append(self._executor.submit(self._compressor.flush))
+        self._executor.shutdown()
+        return b''.join(chunk.result() for chunk in self._chunks)
+
+
+def _common_prefix(a, b):
+    # Length of the common prefix of a and b, by bisecting on slice comparisons
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def _common_suffix(a, b, limit):
+    low, high = 0, min(len(a), len(b), limit)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[len(a) - mid:len(a) - low] == b[len(b) - mid:len(b) - low]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def _fragment_diff(old, new):
+    """[[low, high, data]] patch from old to new replacing everything but their common
+    prefix and suffix, which is all that changes when e.g. a line grows"""
+    prefix = _common_prefix(old, new)
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - prefix)
+    return [[prefix, len(old) - suffix, new[prefix:len(new) - suffix]]]
+
+
+_START_TAG = re.compile(r'<[\w:.-]+(?:\s+[\w:.-]+="[^"]*")*\s*/?>')
+_ATTRIBUTE = re.compile(r'(\s+)([\w:.-]+)="([^"]*)"')
+
+
+def _split_attributes(fragment):
+    # The fragment without its attribute values, and the (name, value) attributes of each of
+    # its elements in document order
+    skeleton, elements, position = [], [], 0
+    for tag in _START_TAG.finditer(fragment):
+        skeleton += [fragment[position:tag.start()], _ATTRIBUTE.sub(r'\1\2=""', tag.group(0))]
+        elements.append([(name, value) for _, name, value in _ATTRIBUTE.findall(tag.group(0))])
+        position = tag.end()
+    skeleton.append(fragment[position:])
+    return skeleton, elements
+
+
+def _attribute_delta(old, new):
+    """{element: {name: value}} of the attributes that differ between fragments old and new, as
+    split by `_split_attributes`, elements being numbered in document order (as strings, like
+    in json). None if anything but attribute values differs."""
+    if old[0] != new[0]:
+        return None
+    delta = {}
+    for element, (old_attributes, new_attributes) in enumerate(zip(old[1], new[1])):
+        changed = {name: value for (name, value), old_attribute in zip(new_attributes, old_attributes)
+                   if (name, value) != old_attribute}
+        if changed:
+            delta[str(element)] = changed
+    return delta
+
+
+def _apply_attributes(fragment, delta):
+    # Set the attributes of an `_attribute_delta` in fragment
+    parts, position = [], 0
+    for element, tag in enumerate(_START_TAG.finditer(fragment)):
+        changed = delta.get(str(element))
+        if changed:
+            parts += [fragment[position:tag.start()], _ATTRIBUTE.sub(
+                lambda m: f'{m.group(1)}{m.group(2)}="{changed[m.group(2)]}"' if m.group(2) in changed
+                else m.group(0), tag.group(0))]
+            position = tag.end()
+    return "".join(parts) + fragment[position:]
+
+
+def _base36(number):
+    digits = ""
+    while True:
+        number, digit = divmod(number, 36)
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + digits
+        if not number:
+            return digits
+
+
+# Gid prefix of the artists until the default one, a hash of the base document, is known
+_PENDING_PREFIX = "pending"
+
+
+# Clip paths, hatches, markers and glyphs (paths with an id) in an svg document
+_SVG_DEF = re.compile(r'[ \t]*<(clipPath|pattern) id="([^"]+)".*?</\1>\n?|[ \t]*<path id="([^"]+)"[^>]*/>\n?', re.S)
+
+
+def _svg_defs(document):
+    # Clip paths, hatches, markers and glyphs defined in an svg document, by id
+    return {match.group(2) or match.group(3): match.group(0) for match in _SVG_DEF.finditer(document)}
+
+
+def _hoist_defs(fragment, defs):
+    # Markers and glyphs are defined where they're first drawn, which is lost once the artist
+    # is drawn again, so they're moved from the fragment to defs (for the base document). Other
+    # definitions (e.g: gouraud shading's gradients) are drawn every time and stay in place
+    def hoist(match):
+        defs.update(_svg_defs(match.group(0)))
+        rest = _SVG_DEF.sub("", match.group(0))
+        return "" if re.fullmatch(r'\s*<defs>\s*</defs>\s*', rest) else rest
+    return re.sub(r'[ \t]*<defs>.*?</defs>\n?', hoist, fragment, flags=re.S)
+
+
+def _id_spans(data, prefix=""):
+    """
+    (start, end, children) byte span of every group with an id starting with prefix in the utf-8
+    encoded svg data, by id, children being the ids of the groups directly within each (and
+    None mapping to those within none). This is a single pass of expat instead of a DOM.
+    """
+    parser = expat.ParserCreate()
+    spans, stack = {}, [(None, 0, [])]
+
+    def start_element(name, attrs):
+        gid = attrs.get("id") if name == "g" else None
+        if gid and gid.startswith(prefix):
+            stack.append((gid, parser.CurrentByteIndex, []))
+        else:
+            # Groups within other elements are children of the closest group with an id
+            stack.append((None, None, stack[-1][2]))
+
+    def end_element(name):
+        gid, start, children = stack.pop()
+        if gid:
+            # The end of an empty element is reported after it, that of others before their end tag
+            end = parser.CurrentByteIndex
+            if data.index(b">", start) + 1 != end or data[end - 2:end] != b"/>":
+                end = data.index(b">", end) + 1
+            spans[gid] = start, end, children
+            stack[-1][2].append(gid)
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.Parse(data, True)
+    spans[None] = stack[0]
+    return spans
+
+
+def _gid_groups(document, prefix):
+    """
+    (own, children, fragment) of the groups in document with an id made from prefix, by id. Own
+    is the group with its children replaced by null characters, and fragment the whole group if
+    it has no children. Both are indented as if drawn on their own.
+    """
+    data = document.encode("utf-8")
+    spans = _id_spans(data, prefix + "_")
+    groups = {None: (None, spans.pop(None)[2], None)}
+    for gid, (start, end, children) in spans.items():
+        dedent = re.compile(b"\n {0,%d}" % (start - data.rfind(b"\n", 0, start) - 1))
+        own, position = [], start
+        for child in children:
+            child_start, child_end, _ = spans[child]
+            own += [data[position:data.rfind(b"\n", 0, child_start) + 1], b"\0"]
+            position = child_end
+        own = dedent.sub(b"\n", b"".join(own) + data[position:end]).decode("utf-8") + "\n"
+        groups[gid] = own, children, None if children else own
+    return groups
+
+
+def _group_fragment(groups, gid):
+    # Whole fragment of the group gid, with its children
+    own, children, fragment = groups[gid]
+    parts = own.split("\0")
+    return fragment or parts[0] + "".join(_group_fragment(groups, child)[:-1] + part
+                                          for child, part in zip(children, parts[1:]))
+
+
+def _placeholder(gid):
+    return f'<g id="{gid}"/>\n'
+
+
+def _draw_frame_range(factory, frames, fargs, fkwargs, gid_prefix, salt):
+    """
+    Worker of SVGFuncAnimation: draw frames in the figure built by factory, returning the
+    fragment of every artist drawn in each frame and the defs they use
+    """
+    with mpl.rc_context({"svg.hashsalt": salt}):
+        fig, func, *init_func = factory()
+        anim = SVGFuncAnimation(fig, func, frames, init_func=init_func[0] if init_func else None,
+                                fargs=fargs, fkwargs=fkwargs, keyframe_interval=None,
+                                embed_limit=float("inf"), factory=factory, gid_prefix=gid_prefix)
+        # Other workers wouldn't know of the artists it creates
+        anim._in_worker = True
+        anim.grab_frames()
+    drawn_frames = [{gid: anim._artist_fragment(i, gid) for gid in frame}
+                    for i, frame in enumerate(anim._embedded_frames)]
+    return drawn_frames, _svg_defs(anim._base_document)
+
+
 def get_all_children(artist):
     if isinstance(artist, Artist):
         for child in artist.get_children():
@@ -293,9 +955,11 @@ class SVGFuncAnimation:
 
             def func(frame, *fargs) -> iterable_of_artists
 
-        *func* must return an iterable of all artists that were modified or
-        created. This information is used by the blitting algorithm to determine
-        which parts of the figure have to be updated.
+        *func* should return an iterable of all artists that were modified.
+        This information is used by the blitting algorithm to determine
+        which parts of the figure have to be updated. In frames where it returns
+        None, or artists created since the animation started, the whole figure is
+        drawn to find the artists that changed, which is slower.
 
     frames : iterable, int, generator function, or None, optional
         Source of data to pass *func* and each frame of the animation
@@ -343,6 +1007,51 @@ class SVGFuncAnimation:
 
     interval : int, default: 200
         Delay between frames in milliseconds.
+
+    blit : bool, default: True
+        Only draw the artists returned by *func*. Otherwise the whole figure is drawn
+        in every frame to find the artists that changed.
+
+    gid_prefix : str, optional
+        Prefix of the artists' gids, which are numbered in the order they appear in the
+        figure, and of the ids in the html. By default, a short hash of the figure as first
+        drawn, *func*'s qualified name and the number of frames, so that identical animations
+        give identical html. Animations only differing after their first frame (e.g: in the
+        data *func* is given) get the same ids, and need different prefixes to be shown on
+        the same page.
+
+    factory : callable, optional
+        A picklable function (e.g: defined at the top level of a module) building the
+        figure and returning ``(fig, func)``, or ``(fig, func, init_func)``, as given. It
+        has to build the figure the same way every time, for the gids to match.
+
+    workers : int, optional
+        Draw the frames in that many processes, each building the figure with *factory*
+        and drawing a contiguous range of frames. *func* must then only depend on the
+        frame it's given, and *frames*, *fargs* and *fkwargs* must be picklable.
+
+    keyframe_interval : int or None, default: 100
+        Store the latest fragment of every artist every *keyframe_interval* frames, so
+        that seeking to a frame (in the player or with `grab_frame`) only applies the
+        frames since the keyframe before it. None disables keyframes, so that seeking
+        applies every frame before (though `grab_frame` in order applies each once).
+
+    diff_fragments : bool, default: False
+        Store each artist's fragment as a diff against its previous version when that's
+        smaller, instead of in full (or of the attributes that changed, if that's all that
+        did), which the player patches. This keeps accumulating plots (e.g: a line growing
+        by a point per frame) linear in size.
+
+    compress : bool or int, default: False
+        Zlib-compress the frames (at this level if an int) while they are grabbed, in a
+        background thread. The player inflates them with ``DecompressionStream``, or a
+        javascript fallback where it is unavailable, before showing the first frame.
+
+    chunk_size : int or None, default: 100
+        Embed the frames in json script elements of that many frames each (along with
+        the fragments they're the first to use), which the player only parses once
+        playback gets close to them rather than all before showing the first frame.
+        None embeds them in the player's script. Compressed frames aren't chunked.
     """
     def __init__(
         self,
@@ -357,6 +1066,13 @@ class SVGFuncAnimation:
         interval=200,
         embed_limit=None,
         blit=True,
+        gid_prefix=None,
+        factory=None,
+        workers=None,
+        keyframe_interval=100,
+        diff_fragments=False,
+        compress=False,
+        chunk_size=100,
     ):
         self._fig = fig
         self._func = func
@@ -368,21 +1084,39 @@ class SVGFuncAnimation:
         self._save_count = save_count
         self._interval = interval
         self._blit = blit
+        self._factory = factory
+        self._workers = workers
+        if workers and not factory:
+            raise ValueError("A factory building the figure is needed to draw frames in workers")
+        if workers and not blit:
+            raise ValueError("Drawing frames in workers needs blitting, with func returning the "
+                             "artists it changed")
+        self._in_worker = False
+        self._keyframe_interval = keyframe_interval
+        self._diff_fragments = diff_fragments
+        self._compress = compress
+        self._chunk_size = chunk_size
 
         self._total_bytes = 0
         self._html_representation = ""
         self._base_document = None
         self._embedded_frames = []
+        self._fragments = []
+        self._fragment_index = {}
+        self._keyframes = {}
+        self._compressed_frames = None
+        self._base_parts = None
+        self._base_fragments = {}
+        self._artist_fragments = {}
+        self._artist_frames_cache = None
+        self._defs = {}
+        self._groups = {}
+        self._gid_count = 0
+        self._placeholders = []
+        self._warnings = set()
         self._vector_renderer = None
         self._renderer = None
 
-        if not self._blit:
-            raise NotImplementedError(
-                "SVGFuncAnimation requires the provided animation "
-                "function to return the artists it has changed, blitting "
-                "must be enabled."
-            )
-
         # Save embed limit, which is given in MB
         if embed_limit is None:
             self._bytes_limit = mpl.rcParams['animation.embed_limit']
@@ -402,24 +1136,10 @@ class SVGFuncAnimation:
         else:
             self._iter_gen = lambda: iter(range(frames))
             self._save_count = frames
-
-    @staticmethod
-    def _find_by_attr(dom, value, attr="id", return_child=True):
-        # this could be done better with a more advanced XML parser but has been
-        # done like so to minimize external dependencies. ElementTree re-writes
-        # and changes the namespaces so we use minidom instead.
-        for index, child in enumerate(dom.childNodes):
-            if isinstance(child, minidom.Element):
-                if child.getAttribute(attr) == value:
-                    if return_child:
-                        return child
-                    return index, dom
-                else:
-                    retval = SVGFuncAnimation._find_by_attr(
-                        child, value, attr=attr, return_child=return_child
-                    )
-                    if retval:
-                        return retval
+        self._gid_prefix = gid_prefix
+        # Clip paths and hatches get the same ids every time (and in every worker), ids being
+        # hashes of their content and of this salt
+        self._hash_salt = gid_prefix or "SVGFuncAnimation"
 
     def _validate_artists(self, artists, name="animation function", set_animated=False):
         # Both `_init_func` and `_func` should return an iterable of artists
@@ -454,10 +1174,26 @@ class SVGFuncAnimation:
         # Clear previous data
         self._base_document = None
         self._embedded_frames = []
+        self._fragments = []
+        self._fragment_index = {}
+        self._keyframes = {}
+        self._compressed_frames = None
+        self._base_parts = None
+        self._base_fragments = {}
+        self._artist_fragments = {}
+        self._artist_frames_cache = None
+        compressor = None
+        if self._compress:
+            compressor = _Compressor(-1 if self._compress is True else self._compress)
+            compressor.write("[")
         self._vector_renderer = None
         self._renderer = None
+        self._defs = {}
+        self._placeholders = []
+        self._warnings = set()
+        salt = mpl.rcParams["svg.hashsalt"] or self._hash_salt
 
-        with StringIO() as f:
+        with StringIO() as f, mpl.rc_context({"svg.hashsalt": salt}):
             # Init figure by adding all artists returned by init_func to the figure
             # And marking them as visible and not animated. This makes sure they get
             # drawn in the first frame. We later mark them as animated for better blitting.
@@ -473,12 +1209,13 @@ class SVGFuncAnimation:
             else:
                 init_artists = []
 
-            # Set the gid of every artist to a uuid, the idea here is that
+            # Set the gid of every artist to a unique id, the idea here is that
             # when an artist is drawn in SVG it will be encased in a group with
             # an id equal to the artist's gid and the gid of an artist doesn't
-            # change when the artist's data changes.
-            for artist in get_all_children(self._fig):
-                artist.set_gid(f"{artist.__class__.__name__}_{uuid.uuid4().hex}")
+            # change when the artist's data changes. Gids are the artists' positions,
+            # so that figures built again agree on them.
+            for self._gid_count, artist in enumerate(get_all_children(self._fig), 1):
+                artist.set_gid(f"{self._gid_prefix or _PENDING_PREFIX}_{_base36(self._gid_count - 1)}")
 
             # Now we can save the initial figure, without finalizing it's renderer.
             # This keeps the renderer._defs from being written until we know all of them.
@@ -488,57 +1225,81 @@ class SVGFuncAnimation:
             width, height = self._fig.get_size_inches()
             w, h = width * 72, height * 72
 
-            self._vector_renderer = RendererSVG(w, h, f, None, dpi)
+            # Without a date, the same figure always gives the same document
+            self._vector_renderer = RendererSVG(w, h, f, None, dpi, metadata={"Date": None})
             self._renderer = MixedModeRenderer(
                 self._fig, width, height, dpi, self._vector_renderer
             )
 
             self._fig.draw(self._renderer)
             base_writer = self._vector_renderer.writer
+            if self._gid_prefix is None:
+                self._set_default_gid_prefix(f)
+            # Markers and glyphs drawn inline are moved to defs, like those of fragments
+            figure = f.getvalue().index(f'<g id="{self._gid_prefix}_')
+            base = _hoist_defs(f.getvalue()[figure:], self._defs)
+            f.seek(figure)
+            f.truncate()
+            f.write(base)
 
             for artist in init_artists:
                 artist.set_animated(self._blit)
 
-            # These group ids will help us detect if an artist that we haven't
-            # encountered before gets drawn. These artists are problematic
-            # because the SVG group associated with them won't be in the
-            # base document so we won't be able to update it properly.
-            known_groups = self._vector_renderer._groupids
+            # The groups of the artists in the base document, to find the artists that
+            # changed when the whole figure is drawn. Artists that we haven't encountered
+            # before are problematic because the SVG group associated with them won't be
+            # in the base document, placeholders are added for them.
+            base = f.getvalue()[f.getvalue().rfind("\n", 0, figure) + 1:]
+            self._groups = {gid: [own, list(children)] for gid, (own, children, _)
+                            in _gid_groups(base, self._gid_prefix).items() if gid is not None}
 
-            # Get all subsequent frames by only drawing
-            # the artists returned by the user's func
-            for framedata in self._iter_gen():
-                drawn_artists = {}
+            # Latest fragment of each artist (and its split attributes), to diff against, and
+            # the fragments embedded as attribute deltas so far
+            previous_fragments, previous_splits, delta_fragments = {}, {}, set()
 
-                # Get all artists that the user returned, if there
-                # aren't any, find all artists in the figure that are stale
-                # and redraw those
-                artists = self._func(framedata, *self._args, **self._kwargs)
-                artists = self._validate_artists(
-                    artists, name="animation function", set_animated=True
-                )
-
-                for artist in artists:
-                    artist_gid = artist.get_gid()
-
-                    # Check that this artist is known
-                    if artist_gid not in known_groups:
-                        raise ValueError(
-                            f"Artist {artist}, with gid={artist.get_gid()}, not recognized. "
-                            f"This usually occurs when the animation function returns a new artist."
-                        )
-
-                    # By switching out the underlying writer we can capture the
-                    # new data but any new defs get captured by the base document.
-                    with StringIO() as artist_f:
-                        writer = XMLWriter(artist_f)
-                        self._vector_renderer.writer = writer
-
-                        self._fig.draw_artist(artist)
-                        drawn_artist = artist_f.getvalue()
-                        self._total_bytes += len(drawn_artist)
-
-                    drawn_artists[artist_gid] = drawn_artist
+            if self._workers:
+                drawn_frames = self._draw_frames_parallel(salt)
+            else:
+                drawn_frames = self._draw_frames()
+            for drawn in drawn_frames:
+                drawn_artists = {}
+                new_fragments = []
+
+                for artist_gid, drawn_artist in drawn.items():
+                    # Artists that didn't change since they were last drawn are left out,
+                    # a frame without changes being empty
+                    if previous_fragments.get(artist_gid) == drawn_artist:
+                        continue
+
+                    # Identical fragments (e.g: of periodic or static artists) are only
+                    # stored once, frames refer to them by their index in the table
+                    index = self._fragment_index.get(drawn_artist)
+                    previous = previous_fragments.get(artist_gid)
+                    split = None
+                    if index is None and previous is not None and drawn_artist not in delta_fragments:
+                        # Otherwise only set the attributes that changed (e.g: the d of a path)
+                        # if that's all that did, which the player does without parsing the
+                        # fragment. Fragments seen again are stored in full.
+                        split = _split_attributes(drawn_artist)
+                        index = _attribute_delta(previous_splits.get(artist_gid) or
+                                                 _split_attributes(previous), split)
+                        size = index and sum(len(value) for changed in index.values()
+                                             for value in changed.values())
+                        if self._diff_fragments:
+                            # Or patch the artist's previous fragment if that's smaller
+                            patch = _fragment_diff(previous, drawn_artist)
+                            if len(patch[0][2]) * 2 < len(drawn_artist) and (
+                                    index is None or len(patch[0][2]) < size):
+                                index, size = patch, len(patch[0][2])
+                        if isinstance(index, dict):
+                            delta_fragments.add(drawn_artist)
+                        if index is not None:
+                            self._total_bytes += size
+                    if index is None:
+                        index = self._add_fragment(drawn_artist, new_fragments)
+                    drawn_artists[artist_gid] = index
+                    previous_fragments[artist_gid] = drawn_artist
+                    previous_splits[artist_gid] = split
 
                 if self._total_bytes >= self._bytes_limit:
                     _log.warning(
@@ -547,43 +1308,422 @@ class SVGFuncAnimation:
                         "embedded, set the animation.embed_limit rc parameter to "
                         "a larger value (in MB). This and further frames will be "
                         "dropped.", self._total_bytes, self._bytes_limit)
+                    for fragment in new_fragments:
+                        del self._fragment_index[fragment]
                     break
                 else:
+                    self._fragments += new_fragments
                     self._embedded_frames.append(drawn_artists)
+                    # New fragments precede the first frame (or keyframe) referring to them
+                    entries = new_fragments + [drawn_artists]
+                    frame_index = len(self._embedded_frames) - 1
+                    if self._keyframe_interval and frame_index and frame_index % self._keyframe_interval == 0:
+                        # The latest fragment of every artist, in full, so that seeking only
+                        # needs the frames since
+                        new_fragments = []
+                        keyframe = {gid: self._add_fragment(fragment, new_fragments)
+                                    for gid, fragment in previous_fragments.items()}
+                        self._fragments += new_fragments
+                        self._keyframes[frame_index] = keyframe
+                        entries += new_fragments + [[frame_index, keyframe]]
+                    if compressor:
+                        compressor.write((", " if frame_index else "") + ", ".join(map(json.dumps, entries)))
 
             # Swap back in the original writer and finalize to get all defs.
             self._vector_renderer.writer = base_writer
             self._renderer.finalize()
             self._base_document = f.getvalue()
+            if self._placeholders:
+                self._base_document = self._insert_placeholders(self._base_document)
+            # Along with those hoisted from the fragments, or drawn by workers
+            base_defs = _svg_defs(self._base_document)
+            defs = "".join(d for gid, d in self._defs.items() if gid not in base_defs)
+            if defs:
+                end = self._base_document.rindex("</svg>")
+                self._base_document = (self._base_document[:end] + " <defs>\n" + defs + " </defs>\n"
+                                       + self._base_document[end:])
+            if compressor:
+                compressor.write("]")
+                self._compressed_frames = compressor.getvalue()
+
+    def _set_default_gid_prefix(self, f):
+        # Hash of the base document (drawn with the pending prefix), of func's qualified name
+        # and of the number of frames, which the artists and the document are renamed after
+        document = f.getvalue()
+        name = getattr(self._func, "__qualname__", type(self._func).__qualname__)
+        key = f"{document}\0{name}\0{self._save_count}"
+        self._gid_prefix = "a" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]
+        f.seek(0)
+        f.truncate()
+        f.write(document.replace(f'id="{_PENDING_PREFIX}_', f'id="{self._gid_prefix}_'))
+        for artist in get_all_children(self._fig):
+            gid = artist.get_gid()
+            if gid and gid.startswith(_PENDING_PREFIX + "_"):
+                artist.set_gid(self._gid_prefix + gid[len(_PENDING_PREFIX):])
+
+    def _draw_frames(self):
+        # Get all subsequent frames by only drawing the artists returned by the
+        # user's func, yielding the fragment of each
+        for framedata in self._iter_gen():
+            drawn_artists = {}
+
+            # Get all artists that the user returned, if there
+            # aren't any, or some are new, find all artists in
+            # the figure that changed and redraw those
+            artists = self._func(framedata, *self._args, **self._kwargs)
+            if artists is not None:
+                artists = self._validate_artists(
+                    artists, name="animation function", set_animated=True
+                )
+            if not self._blit or artists is None or any(a.get_gid() not in self._groups for a in artists):
+                yield self._find_changes()
+                continue
+
+            for artist in artists:
+                artist_gid = artist.get_gid()
+
+                # By switching out the underlying writer we can capture the
+                # new data but any new defs get captured by the base document.
+                with StringIO() as artist_f:
+                    writer = XMLWriter(artist_f)
+                    self._vector_renderer.writer = writer
+
+                    self._fig.draw_artist(artist)
+                    drawn_artists[artist_gid] = _hoist_defs(artist_f.getvalue(), self._defs)
+                if not self._groups[artist_gid][1]:
+                    self._groups[artist_gid][0] = drawn_artists[artist_gid]
+
+            yield drawn_artists
+
+    def _set_gids(self):
+        # Give a gid to the artists created since they were last set, returning how many
+        new_artists = [artist for artist in get_all_children(self._fig) if artist.get_gid() is None]
+        for artist in new_artists:
+            artist.set_gid(f"{self._gid_prefix}_{_base36(self._gid_count)}")
+            self._gid_count += 1
+        return len(new_artists)
+
+    def _find_changes(self):
+        # Draw the whole figure, returning the fragments of the artists that changed
+        if self._in_worker:
+            raise ValueError("Frames can only be drawn in workers if func returns the artists it "
+                             "changed, none of which are new")
+        if self._blit and "blit" not in self._warnings:
+            self._warnings.add("blit")
+            _log.warning("The animation function returned None or new artists, such frames are "
+                         "drawn in full to find the artists that changed, which is slower.")
+        # Animated artists (those func returned, when blitting) are left out of figure draws
+        animated = [artist for artist in get_all_children(self._fig) if artist.get_animated()]
+        with StringIO() as f:
+            self._vector_renderer.writer = XMLWriter(f)
+            self._set_gids()
+            for artist in animated:
+                artist.set_animated(False)
+            try:
+                self._fig.draw(self._renderer)
+                # Some artists, e.g: ticks, are created while drawing
+                if self._set_gids():
+                    f.seek(0)
+                    f.truncate()
+                    self._fig.draw(self._renderer)
+            finally:
+                for artist in animated:
+                    artist.set_animated(True)
+            groups = _gid_groups(_hoist_defs(f.getvalue(), self._defs), self._gid_prefix)
+        drawn_artists = {}
+        for gid in groups[None][1]:
+            if gid in self._groups:
+                self._diff_group(groups, gid, drawn_artists)
+        return drawn_artists
+
+    def _diff_group(self, groups, gid, drawn_artists):
+        # Compare the group gid of the figure drawn in full to that of the document, adding the
+        # fragments of the artists that changed. Only artists without children are updated so
+        # that the groups updated are never nested.
+        own, children = self._groups[gid]
+        new_own, new_children, _ = groups[gid]
+        if not children:
+            fragment = _group_fragment(groups, gid)
+            if fragment != own:
+                drawn_artists[gid] = self._groups[gid][0] = fragment
+            return
+        kept = [child for child in new_children if child in children]
+        if (new_own.replace("\0\n", "") != own.replace("\0\n", "")
+                or kept != [child for child in children if child in new_children]):
+            if gid not in self._warnings:
+                self._warnings.add(gid)
+                _log.warning("The group %s changed outside of its artists' groups, which "
+                             "can't be animated.", gid)
+        for child in children:
+            if child not in new_children:
+                self._clear_group(child, drawn_artists)
+        previous = None
+        for child in new_children:
+            if child not in self._groups:
+                # A new artist, with a placeholder in the base document
+                children.insert(children.index(previous) + 1 if previous else 0, child)
+                self._placeholders.append((gid, previous, child, self._add_placeholder(groups, child)))
+            self._diff_group(groups, child, drawn_artists)
+            previous = child
+
+    def _insert_placeholders(self, document):
+        # Insert the placeholders of the new artists in the base document, each right after its
+        # previous sibling or else the start tag of its parent. Those may be in placeholders too,
+        # which are spliced in turn as they're written out, so that every part is parsed once.
+        placeholders, anchored = {}, {}
+        for parent, previous, gid, placeholder in self._placeholders:
+            placeholders[gid] = placeholder.encode("utf-8")
+            anchored.setdefault((previous, True) if previous else (parent, False), []).append(gid)
+        output, stack = [], [(document.encode("utf-8"), True)]
+        while stack:
+            data, splice = stack.pop()
+            if not splice:
+                output.append(data)
+                continue
+            points = []
+            for gid, (start, end, _) in _id_spans(data, self._gid_prefix + "_").items():
+                if (gid, False) in anchored:
+                    points.append((data.index(b">", start) + 2, anchored[gid, False]))
+                if (gid, True) in anchored:
+                    points.append((end + 1, anchored[gid, True]))
+            parts, position = [], 0
+            for point, gids in sorted(points, key=lambda point: point[0]):
+                # The latest inserted at a point goes first
+                parts += [(data[position:point], False)] + [(placeholders[gid], True) for gid in reversed(gids)]
+                position = point
+            parts.append((data[position:], False))
+            stack += reversed(parts)
+        return b"".join(output).decode("utf-8")
+
+    def _add_placeholder(self, groups, gid):
+        # Placeholder of a new artist and its children, each empty
+        own, children, _ = groups[gid]
+        if not children:
+            self._groups[gid] = [_placeholder(gid), []]
+            return _placeholder(gid)
+        self._groups[gid] = [own, list(children)]
+        parts = own.split("\0")
+        return parts[0] + "".join(self._add_placeholder(groups, child)[:-1] + part
+                                  for child, part in zip(children, parts[1:]))
+
+    def _clear_group(self, gid, drawn_artists):
+        # Empty the artists of a group that's no longer drawn
+        own, children = self._groups[gid]
+        for child in children:
+            self._clear_group(child, drawn_artists)
+        if not children and own != _placeholder(gid):
+            drawn_artists[gid] = self._groups[gid][0] = _placeholder(gid)
+
+    def _draw_frames_parallel(self, salt):
+        # Contiguous ranges of frames drawn by workers, each building the figure again
+        frames = list(self._iter_gen())
+        size = max(1, -(-len(frames) // self._workers))
+        executor = ProcessPoolExecutor(self._workers)
+        try:
+            chunks = [executor.submit(_draw_frame_range, self._factory, frames[i:i + size], self._args,
+                                      self._kwargs, self._gid_prefix, salt)
+                      for i in range(0, len(frames), size)]
+            for chunk in chunks:
+                drawn_frames, defs = chunk.result()
+                self._defs.update(defs)
+                yield from drawn_frames
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _add_fragment(self, fragment, new_fragments):
+        # Index of fragment in the table, adding it to new_fragments if it's new
+        index = self._fragment_index.get(fragment)
+        if index is None:
+            index = self._fragment_index[fragment] = len(self._fragment_index)
+            new_fragments.append(fragment)
+            self._total_bytes += len(fragment)
+        return index
+
+    def _artist_fragment(self, index, gid):
+        # Fragment of the artist gid at frame index, patching (or setting the attributes of)
+        # its previous ones (or the last one computed, or a keyframe's) if needed
+        patches = []
+        for i in range(index, -1, -1):
+            entry = self._embedded_frames[i].get(gid)
+            cached = self._artist_fragments.get(gid)
+            keyframe = self._keyframes.get(i, {})
+            if cached and cached[0] == i:
+                fragment = cached[1]
+                break
+            elif gid in keyframe:
+                fragment = self._fragments[keyframe[gid]]
+                break
+            elif isinstance(entry, int):
+                fragment = self._fragments[entry]
+                break
+            elif entry is not None:
+                patches.append(entry)
+        for patch in reversed(patches):
+            if isinstance(patch, dict):
+                fragment = _apply_attributes(fragment, patch)
+                continue
+            # Operations are sorted, applying the last first keeps offsets valid
+            for low, high, data in reversed(patch):
+                fragment = fragment[:low] + data + fragment[high:]
+        self._artist_fragments[gid] = index, fragment
+        return fragment
+
+    def _artist_frames(self, index):
+        # Frame of the latest fragment of every artist drawn by frame index: the keyframe
+        # before it, unless drawn in a later frame. Those of the frame last asked for are
+        # kept, so that frames after it (e.g: grabbing every frame in order without
+        # keyframes) start from there rather than from the keyframe.
+        keyframe = max((k for k in self._keyframes if k <= index), default=-1)
+        if self._artist_frames_cache and keyframe <= self._artist_frames_cache[0] <= index:
+            start, latest = self._artist_frames_cache
+        else:
+            start, latest = keyframe, dict.fromkeys(self._keyframes.get(keyframe, ()), keyframe)
+        for i in range(start + 1, index + 1):
+            latest.update(dict.fromkeys(self._embedded_frames[i], i))
+        self._artist_frames_cache = index, latest
+        return dict(latest)
+
+    def _index_base_document(self):
+        # Scan the base document once, and split it around each animated artist so
+        # that frames are spliced together from its parts
+        data = self._base_document.encode("utf-8")
+        spans = _id_spans(data, self._gid_prefix + "_")
+        gids = sorted(set().union(*self._embedded_frames), key=lambda gid: spans[gid][0])
+        # Alternating parts of the document and gids
+        self._base_parts, position = [], 0
+        for gid in gids:
+            start, end, _ = spans[gid]
+            if start < position:
+                # Within an artist that's already split out
+                continue
+            self._base_parts += [data[position:start].decode("utf-8"), gid]
+            self._base_fragments[gid] = data[start:end].decode("utf-8")
+            position = end
+        self._base_parts.append(data[position:].decode("utf-8"))
 
     def grab_frame(self, index):
         self.grab_frames()
-        # Note: we use minidom instead of etree as etree messes up the namespaces
-        base = minidom.parseString(self._base_document)
-        for gid, data in self._embedded_frames[index].items():
-            index, parent = self._find_by_attr(base, gid, return_child=False)
-            # Slightly abuse text nodes to inject XML chunks into doc (requires unescaping)
-            parent.childNodes[index] = base.createTextNode(data)
-        return unescape(base.toxml())
+        if self._base_parts is None:
+            self._index_base_document()
+        latest = self._artist_frames(index)
+        parts = self._base_parts[:]
+        for i in range(1, len(parts), 2):
+            gid = parts[i]
+            parts[i] = self._artist_fragment(latest[gid], gid) if gid in latest else self._base_fragments[gid]
+        return "".join(parts)
+
+    def iter_frames(self):
+        """
+        Yield every frame as a standalone svg document, in order. The artists a frame
+        doesn't draw keep their latest fragment, and only one frame is held in memory.
+        """
+        self.grab_frames()
+        if self._base_parts is None:
+            self._index_base_document()
+        parts = self._base_parts[:]
+        positions = {}
+        for i in range(1, len(parts), 2):
+            positions[parts[i]] = i
+            parts[i] = self._base_fragments[parts[i]]
+        for index, frame in enumerate(self._embedded_frames):
+            for gid in frame:
+                parts[positions[gid]] = self._artist_fragment(index, gid)
+            yield "".join(parts)
+
+    def save_frames(self, directory, convert=None, executor=None):
+        """
+        Write every frame to *directory* as frame<index>.svg, one at a time, and return
+        their paths. *convert* (e.g: a function rasterizing an svg file) is then called
+        with each path, in *executor* if given (it must be picklable for a process pool),
+        while the next frames are written.
+        """
+        self.grab_frames()
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        digits = len(str(len(self._embedded_frames) - 1))
+        paths, conversions = [], []
+        for index, frame in enumerate(self.iter_frames()):
+            path = Path(directory, f"frame{index:0{digits}d}.svg")
+            path.write_text(frame, encoding="utf-8")
+            paths.append(path)
+            if convert and executor:
+                conversions.append(executor.submit(convert, path))
+            elif convert:
+                convert(path)
+        for conversion in conversions:
+            conversion.result()
+        return paths
 
     def save(self, filename):
         self.grab_frames()
         mode_dict = dict(once_checked="", loop_checked="", reflect_checked="")
         mode_dict[self._default_mode + "_checked"] = "checked"
 
+        # Frames are written one at a time so that the document is never held in memory
         with open(filename, "w", encoding="utf-8") as of:
             of.write(JS_INCLUDE + STYLE_INCLUDE)
-            of.write(
-                DISPLAY_TEMPLATE.format(
-                    id=uuid.uuid4().hex,
-                    Nframes=len(self._embedded_frames),
-                    fill_frames=self._embedded_frames,
-                    base_document=self._base_document,
-                    interval=self._interval,
-                    **mode_dict,
-                )
+            chunks, chunk_ids = [], "[]"
+            if self._compressed_frames is None and self._chunk_size:
+                fragments = frames = ["[]"]
+                keyframes, compressed = ["{}"], ["null"]
+                chunks = self._iter_chunk_scripts()
+                chunk_ids = json.dumps([f"_anim_chunk{self._gid_prefix}_{k}" for k in
+                                        range(-(-len(self._embedded_frames) // self._chunk_size))])
+            elif self._compressed_frames is None:
+                fragments, frames = _iter_array_js(self._fragments), _iter_array_js(self._embedded_frames)
+                keyframes, compressed = [json.dumps(self._keyframes)], ["null"]
+            else:
+                compressed = ['inflateFrames("', base64.b64encode(self._compressed_frames).decode("ascii"),
+                              '")']
+                fragments = frames = ["[]"]
+                keyframes = ["{}"]
+            _write_template(
+                of,
+                DISPLAY_TEMPLATE,
+                dict(
+                    fragments=fragments,
+                    keyframes=keyframes,
+                    fill_frames=frames,
+                    base_document=[self._base_document],
+                    compressed=compressed,
+                    frame_chunks=chunks,
+                ),
+                id=self._gid_prefix,
+                chunk_ids=chunk_ids,
+                Nframes=len(self._embedded_frames),
+                interval=self._interval,
+                **mode_dict,
             )
 
+    def _iter_frame_entries(self):
+        # Entries of each frame, as embedded: the fragments it's the first to use, the
+        # frame, and its keyframe if any (preceded by the fragments it's the first to use)
+        fragment_count = 0
+
+        def with_fragments(indices, entry):
+            nonlocal fragment_count
+            used = max([i + 1 for i in indices if isinstance(i, int)] + [fragment_count])
+            entries = self._fragments[fragment_count:used] + [entry]
+            fragment_count = used
+            return entries
+
+        for index, frame in enumerate(self._embedded_frames):
+            entries = with_fragments(frame.values(), frame)
+            if index in self._keyframes:
+                entries += with_fragments(self._keyframes[index].values(), [index, self._keyframes[index]])
+            yield entries
+
+    def _iter_chunk_scripts(self):
+        # A json script element per chunk_size frames
+        entries = self._iter_frame_entries()
+        for k in itertools.count():
+            chunk = list(itertools.chain.from_iterable(itertools.islice(entries, self._chunk_size)))
+            if not chunk:
+                return
+            # Nothing in the json may end the script element
+            data = json.dumps(chunk).replace("</", "<\\/").replace("<!--", "\\u003c!--")
+            yield f'\n<script type="application/json" id="_anim_chunk{self._gid_prefix}_{k}">{data}</script>'
+
     def to_jshtml(self):
         if not self._html_representation:
             with TemporaryDirectory() as tmpdir:
@@ -0,0 +1,459 @@
+import re
+import json
+import zlib
+import base64
+import random
+import shutil
+import pytest
+import subprocess
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+from matplotlib.animation import FuncAnimation, HTMLWriter
+
+from HTMLDiffWriter import (HTMLDiffWriter, DIFF_BACKENDS, _diff_frames, _myers_opcodes, _add_base64_prefix,
+                            _select_checkpoints, _reverse_diff, _frame_diffs,
+                            _write_template, JS_INCLUDE)
+
+requires_node = pytest.mark.skipif(shutil.which("node") is None, reason="node is needed to run the player")
+
+# Just enough of a DOM to run the player in node
+DOM_STUB = """
+const elements = {};
+globalThis.navigator = {userAgent: "node"};
+globalThis.document = new Proxy({
+  getElementById(id) {
+    return elements[id] || (elements[id] = {src: "", value: 0, max: 0, setAttribute() {}, getAttribute() {}});
+  },
+  createElement(tag) {
+    return {};
+  },
+  head: {
+    // Load scripts relative to BASE_DIR
+    appendChild(script) {
+      const code = require("fs").readFileSync(require("path").join(BASE_DIR, script.src), "utf8");
+      setTimeout(() => (0, eval)(code), 0);
+    }
+  }
+}, {get: (target, key) => key in target ? target[key] : {state: [{checked: true, value: "once"}]}});
+"""
+
+
+def apply_patch(base, patch):
+    # Python port of the javascript applyPatch
+    target, pos = [], 0
+    for low, high, data in patch:
+        target += [base[pos:low], data]
+        pos = high
+    return ''.join(target) + base[pos:]
+
+
+def get_line_anim(size, fmt="r-"):
+    np.random.seed(0)
+
+    fig = plt.figure()
+    data = np.random.rand(size)
+    (l,) = plt.plot([], [], fmt)
+    plt.xlim(0, size - 1)
+    plt.ylim(0, 1)
+
+    def update_line(num, data, line):
+        line.set_data(range(num+1), data[:num+1])
+        return (line,)
+
+    anim = FuncAnimation(fig, update_line, range(size), fargs=(data, l))
+    plt.close(fig)
+    return anim
+
+
+def get_saved_frames(anim, tmpdir):
+    with mpl.rc_context({"animation.frame_format": "svg"}):
+        path = Path(tmpdir, "temp.html")
+        writer = HTMLWriter(embed_frames=True)
+        anim.save(str(path), writer=writer)
+        return [frame.replace("\n", "") for frame in writer._saved_frames]
+
+
+def save_diff_anim(anim, tmpdir, frame_format="svg", embed_frames=True, **kwargs):
+    with mpl.rc_context({"animation.frame_format": frame_format}):
+        path = Path(tmpdir, "temp.html")
+        writer = HTMLDiffWriter(embed_frames=embed_frames, **kwargs)
+        anim.save(str(path), writer=writer)
+    frames = _add_base64_prefix([f.replace("\n", "") for f in writer._saved_frames], writer.frame_format)
+    return path.read_text(), frames
+
+
+def run_player(html, script, base_dir=".", prelude=""):
+    # Run the player in node, `anim` being the animation once created, and return what script logs as JSON
+    scripts = re.findall(r'<script language="javascript">(.*?)</script>', html, re.S)
+    anim_id = re.search(r"(anim\w+) = new Animation", html).group(1)
+    code = f"const BASE_DIR = {json.dumps(str(base_dir))};\n" + DOM_STUB + prelude + "\n".join(scripts) + \
+        f"\n;(function start() {{ if (typeof {anim_id} === 'undefined') return setTimeout(start, 1);\n" \
+        f"const anim = {anim_id};\n{script}\n}})();"
+    out = subprocess.run(["node"], input=code, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def play_frames(html, order, prelude=""):
+    return run_player(html, prelude=prelude, script=f"""
+        const srcs = [];
+        for (const i of {json.dumps(order)}) {{
+            anim.set_frame(i);
+            srcs.push(document.getElementById(anim.img_id).src);
+        }}
+        console.log(JSON.stringify(srcs));
+    """)
+
+
+def random_edit(rng, s, alphabet="abcdef <>/\"+"):
+    s = list(s)
+    for _ in range(rng.randint(0, 10)):
+        i = rng.randint(0, len(s))
+        op = rng.choice(["insert", "delete", "replace"])
+        chunk = [rng.choice(alphabet) for _ in range(rng.randint(1, 20))]
+        if op == "insert":
+            s[i:i] = chunk
+        elif op == "delete":
+            del s[i:i + len(chunk)]
+        else:
+            s[i:i + len(chunk)] = chunk
+    return "".join(s)
+
+
+@pytest.mark.parametrize("backend", DIFF_BACKENDS)
+@pytest.mark.parametrize("frame1, frame2", [
+    ["", ""], ["", "abc"], ["abc", ""], ["abc", "abc"], ["abc", "abcd"], ["abc", "xabc"],
+    ["<g id=\"a\"/>", "<g id=\"b\"/>"], ["aaaa bbbb cccc", "aaaa cccc bbbb"],
+])
+def test_diff_roundtrip(backend, frame1, frame2):
+    assert apply_patch(frame1, _diff_frames(frame1, frame2, backend=backend)) == frame2
+
+
+def test_diff_backend_callable():
+    # Any callable, even an unhashable one, rather than a name
+    class Backend:
+        __hash__ = None
+
+        def __call__(self, a, b):
+            return DIFF_BACKENDS["myers"](a, b)
+
+    backend = Backend()
+    assert apply_patch("aaaa bbbb", _diff_frames("aaaa bbbb", "aaaa cccc", backend=backend)) == "aaaa cccc"
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_myers_random_edits(seed):
+    rng = random.Random(seed)
+    frame1 = "".join(rng.choice("abcdef <>/\"+") for _ in range(rng.randint(0, 2000)))
+    frame2 = random_edit(rng, frame1)
+    assert apply_patch(frame1, _diff_frames(frame1, frame2)) == frame2
+
+
+def test_myers_opcodes_sorted():
+    rng = random.Random(0)
+    frame1 = base64.b64encode(rng.randbytes(5000)).decode("ascii")
+    frame2 = random_edit(rng, frame1)
+    opcodes = _myers_opcodes(frame1, frame2)
+    for (_, i2, _, j2), (i1, _, j1, _) in zip(opcodes, opcodes[1:]):
+        assert i2 < i1 and j2 < j1
+
+
+@pytest.mark.parametrize("backend", DIFF_BACKENDS)
+@pytest.mark.parametrize("seed", range(10))
+def test_reverse_diff(backend, seed):
+    rng = random.Random(seed)
+    frame1 = "".join(rng.choice("abcdef <>/\"+") for _ in range(rng.randint(0, 500)))
+    frame2 = random_edit(rng, frame1)
+    reverse = _reverse_diff(frame1, _diff_frames(frame1, frame2, backend=backend))
+    assert apply_patch(frame2, reverse) == frame1
+
+
+@pytest.mark.parametrize("backend", DIFF_BACKENDS)
+def test_diff_svg_frames(tmpdir, backend):
+    frames = get_saved_frames(get_line_anim(5), tmpdir)
+    for frame1, frame2 in zip(frames, frames[1:]):
+        patch = _diff_frames(frame1, frame2, backend=backend)
+        assert apply_patch(frame1, patch) == frame2
+
+
+@pytest.mark.parametrize("chunks", [None, 1, 2, 3, 100])
+@pytest.mark.parametrize("executor", [None, ThreadPoolExecutor])
+@pytest.mark.parametrize("num_frames", [1, 2, 7])
+def test_frame_diffs_parallel(num_frames, executor, chunks):
+    rng = random.Random(0)
+    frames = ["".join(rng.choice("abcdef <>/\"+") for _ in range(200))]
+    for _ in range(num_frames - 1):
+        frames.append(random_edit(rng, frames[-1]))
+    executor = executor and executor(2)
+    diffs = _frame_diffs(frames, parallel=True, executor=executor, chunks=chunks)
+    assert diffs == _frame_diffs(frames)
+    assert len(diffs) == num_frames - 1
+
+
+def test_myers_patch_size(tmpdir):
+    # The myers backend should not produce much larger patches than difflib
+    frames = get_saved_frames(get_line_anim(5), tmpdir)
+    for frame1, frame2 in zip(frames, frames[1:]):
+        myers = sum(len(data) + 8 for *_, data in _diff_frames(frame1, frame2, backend="myers"))
+        difflib = sum(len(data) + 8 for *_, data in _diff_frames(frame1, frame2, backend="difflib"))
+        assert myers <= 1.5 * difflib
+
+
+def test_decode_frames_smaller(tmpdir):
+    # Compressed formats (e.g: png) change throughout, decoded or not, so only svg is smaller
+    anim = get_line_anim(5)
+    html, _ = save_diff_anim(anim, tmpdir, parallel=False)
+    decoded_html, _ = save_diff_anim(anim, tmpdir, parallel=False, decode_frames=True)
+    assert len(decoded_html) < len(html)
+
+
+@requires_node
+@pytest.mark.parametrize("decode_frames", [False, True])
+@pytest.mark.parametrize("frame_format", ["svg", "png"])
+def test_player_frames(tmpdir, frame_format, decode_frames):
+    html, frames = save_diff_anim(get_line_anim(6), tmpdir, frame_format=frame_format,
+                                  parallel=False, decode_frames=decode_frames)
+    order = [0, 1, 2, 3, 4, 5, 5, 2, 4, 0, 3]
+    assert play_frames(html, order) == [frames[i] for i in order]
+
+
+def test_write_template():
+    with StringIO() as f:
+        _write_template(f, "{x} {{y}} {frames} {x}{z}", dict(frames=iter(["a", "b"]), z=[]), x=1)
+        assert f.getvalue() == "1 {y} ab 1"
+
+
+@requires_node
+@pytest.mark.parametrize("diff_encoding", ["json", "varint"])
+@pytest.mark.parametrize("decode_frames", [False, True])
+@pytest.mark.parametrize("frame_format", ["svg", "png"])
+def test_player_diff_encoding(tmpdir, frame_format, decode_frames, diff_encoding):
+    html, frames = save_diff_anim(get_line_anim(6), tmpdir, frame_format=frame_format, parallel=False,
+                                  decode_frames=decode_frames, diff_encoding=diff_encoding,
+                                  reverse_diffs=True, checkpoint_interval=3)
+    assert "    diff_frames[" not in html
+    order = [0, 1, 2, 3, 4, 5, 5, 2, 4, 0, 3, 2]
+    assert play_frames(html, order) == [frames[i] for i in order]
+
+
+def test_diff_encoding_invalid():
+    with pytest.raises(ValueError):
+        HTMLDiffWriter(diff_encoding="xml")
+
+
+@pytest.mark.parametrize("interval, threshold, expected", [
+    [None, None, [0]], [2, None, [0, 2, 4]], [None, 5, [0, 2, 3]], [4, 7, [0, 3]], [3, 7, [0, 3]],
+])
+def test_select_checkpoints(interval, threshold, expected):
+    diffs = [[[0, 1, "abc"]], [[0, 1, "abc"]], [[0, 1, "abcdef"]], [[0, 0, "a"]], [[0, 0, "a"]]]
+    assert _select_checkpoints(diffs, interval=interval, threshold=threshold) == expected
+
+
+@requires_node
+@pytest.mark.parametrize("checkpoints", [{"checkpoint_interval": 3}, {"checkpoint_threshold": 0}])
+def test_player_checkpoints(tmpdir, checkpoints):
+    html, frames = save_diff_anim(get_line_anim(8), tmpdir, parallel=False, decode_frames=True,
+                                  **checkpoints)
+    assert html.count("checkpoint_frames[") > 1
+    order = [0, 7, 1, 2, 3, 5, 4, 6, 2, 0]
+    assert play_frames(html, order) == [frames[i] for i in order]
+
+
+@requires_node
+@pytest.mark.parametrize("checkpoints", [{}, {"checkpoint_interval": 4}])
+def test_player_reverse_diffs(tmpdir, checkpoints):
+    html, frames = save_diff_anim(get_line_anim(8), tmpdir, parallel=False, reverse_diffs=True,
+                                  **checkpoints)
+    order = [7, 6, 5, 4, 3, 2, 1, 0, 7, 2, 5, 3]
+    # Stepping back from the last frame should apply a single (reverse) diff
+    patches = run_player(html, """
+        let count = 0;
+        const apply = applyPatch;
+        applyPatch = (base, patch) => (count++, apply(base, patch));
+        anim.set_frame(7);
+        count = 0;
+        anim.set_frame(6);
+        console.log(count);
+    """)
+    assert patches == 1
+    assert play_frames(html, order) == [frames[i] for i in order]
+
+
+@requires_node
+def test_player_cache(tmpdir):
+    html, frames = save_diff_anim(get_line_anim(8), tmpdir, parallel=False)
+    # Seeking to 6 should start from the cached frame 5 rather than from 0 or 2
+    patches = run_player(html, """
+        let count = 0;
+        const apply = applyPatch;
+        applyPatch = (base, patch) => (count++, apply(base, patch));
+        anim.set_frame(5);
+        anim.set_frame(2);
+        count = 0;
+        anim.set_frame(6);
+        console.log(count);
+    """)
+    assert patches == 1
+    order = [7, 3, 5, 1, 6, 4, 0, 2]
+    assert play_frames(html, order) == [frames[i] for i in order]
+
+
+@requires_node
+def test_player_drop_frames(tmpdir):
+    html, frames = save_diff_anim(get_line_anim(100), tmpdir, parallel=False)
+    # Frames taking longer than the interval are skipped, their diffs being applied together
+    shown, patches, stats, src = run_player(html, """
+        let count = 0;
+        const apply = applyPatch;
+        applyPatch = (base, patch) => (count++, apply(base, patch));
+        const set_frame = anim.set_frame, shown = [];
+        anim.set_frame = function(frame) {
+            const start = Date.now();
+            while (Date.now() - start < 30);
+            shown.push(frame);
+            set_frame.call(this, frame);
+        };
+        anim.interval = 10;
+        anim.play_animation();
+        const wait = setInterval(() => {
+            if (anim.direction) return;
+            clearInterval(wait);
+            const src = document.getElementById(anim.img_id).src;
+            console.log(JSON.stringify([shown, count, anim.stats, src]));
+        }, 5);
+    """)
+    assert shown == sorted(shown) and shown[-1] == 99 and len(shown) < 50
+    assert patches == 99
+    assert stats["dropped"] > 0 and stats["shown"] + stats["dropped"] >= 99
+    assert 0 < stats["fps"] < 40
+    assert src == frames[-1]
+
+
+@requires_node
+def test_player_cache_eviction(tmpdir):
+    html, _ = save_diff_anim(get_line_anim(2), tmpdir, parallel=False)
+    keys = run_player(html, """
+        anim.cache = new Map();
+        anim.cache_bytes = 0;
+        anim.cache_size = 10;
+        anim.cache_put(1, "aaaa");
+        anim.cache_put(2, "bbbb");
+        anim.cache_get(1);
+        anim.cache_put(3, "cccc");
+        anim.cache_put(4, "too large to be cached");
+        console.log(JSON.stringify([[...anim.cache.keys()], anim.cache_bytes, anim.cached_before(2)]));
+    """)
+    assert keys == [[1, 3], 8, 1]
+
+
+@requires_node
+@pytest.mark.parametrize("backend", DIFF_BACKENDS)
+def test_player_apply_patch(tmpdir, backend):
+    rng = random.Random(0)
+    cases = []
+    for _ in range(20):
+        frame1 = "".join(rng.choice("abcdef <>/\"+") for _ in range(rng.randint(0, 500)))
+        frame2 = random_edit(rng, frame1)
+        cases.append([frame1, _diff_frames(frame1, frame2, backend=backend), frame2])
+    html, _ = save_diff_anim(get_line_anim(2), tmpdir, parallel=False)
+    results = run_player(html, f"""
+        console.log(JSON.stringify({json.dumps(cases)}.map(([base, patch]) => applyPatch(base, patch))));
+    """)
+    assert results == [frame2 for *_, frame2 in cases]
+
+
+@pytest.mark.parametrize("executor", [None, ThreadPoolExecutor])
+@pytest.mark.parametrize("options", [
+    {}, {"decode_frames": True, "checkpoint_threshold": 2000, "reverse_diffs": True},
+])
+def test_stream(tmpdir, monkeypatch, options, executor):
+    # Streaming should embed exactly the same diffs and checkpoints
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "0")
+    anim = get_line_anim(8)
+    with mpl.rc_context({"svg.hashsalt": "test"}):
+        html, _ = save_diff_anim(anim, tmpdir, parallel=False, **options)
+        stream_html, _ = save_diff_anim(anim, tmpdir, stream=True, parallel=executor is not None,
+                                        executor=executor and executor(2), **options)
+    assert re.sub("[0-9a-f]{32}", "", stream_html) == re.sub("[0-9a-f]{32}", "", html)
+
+
+@requires_node
+@pytest.mark.parametrize("options", [
+    {}, {"stream": True, "reverse_diffs": True, "decode_frames": True, "diff_encoding": "varint"},
+])
+def test_player_segments(tmpdir, monkeypatch, options):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "0")
+    anim = get_line_anim(12)
+    with mpl.rc_context({"svg.hashsalt": "test"}):
+        _, frames = save_diff_anim(anim, tmpdir, parallel=False)
+        html, _ = save_diff_anim(anim, tmpdir, parallel=False, embed_frames=False,
+                                 checkpoint_interval=2, **options)
+    assert "    checkpoint_frames[" not in html
+    assert sorted(path.name for path in Path(tmpdir, "temp_frames").iterdir()) == \
+        [f"segment{i}.js" for i in range(6)]
+
+    order = [0, 11, 1, 2, 5, 4, 10, 9, 3, 0]
+    srcs, loaded = run_player(html, f"""
+        (async () => {{
+            const srcs = [];
+            for (const i of {order}) {{
+                anim.set_frame(i);
+                while (anim.pending_frame !== undefined) await new Promise(r => setTimeout(r, 1));
+                srcs.push(document.getElementById(anim.img_id).src);
+            }}
+            const loaded = Object.keys(anim.segment_state).filter(k => anim.segment_state[k] == "loaded");
+            console.log(JSON.stringify([srcs, loaded.map(Number)]));
+        }})();
+    """, base_dir=tmpdir)
+    assert srcs == [frames[i] for i in order]
+    # Far away segments are unloaded
+    assert set(loaded) <= {0, 1, 2}
+
+
+@requires_node
+@pytest.mark.parametrize("options", [
+    {}, {"decode_frames": True, "reverse_diffs": True, "checkpoint_interval": 3},
+    {"decode_frames": True, "frame_format": "png", "diff_encoding": "varint", "compress": 9},
+    {"stream": True, "reverse_diffs": True, "checkpoint_interval": 3},
+])
+@pytest.mark.parametrize("fallback", [False, True])
+def test_player_compress(tmpdir, monkeypatch, options, fallback):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "0")
+    anim = get_line_anim(6)
+    options = dict(options)
+    frame_format = options.pop("frame_format", "svg")
+    with mpl.rc_context({"svg.hashsalt": "test"}):
+        _, frames = save_diff_anim(anim, tmpdir, frame_format=frame_format, parallel=False)
+        html, _ = save_diff_anim(anim, tmpdir, frame_format=frame_format, parallel=False,
+                                 **{"compress": True, **options})
+    assert "    diff_frames[" not in html and "    checkpoint_frames[" not in html
+    prelude = "delete globalThis.DecompressionStream;\n" if fallback else ""
+    order = [0, 1, 2, 3, 4, 5, 5, 2, 4, 0, 3, 2]
+    assert play_frames(html, order, prelude=prelude) == [frames[i] for i in order]
+
+
+def test_compress_smaller(tmpdir):
+    anim = get_line_anim(20)
+    html, _ = save_diff_anim(anim, tmpdir, parallel=False, decode_frames=True)
+    compressed_html, _ = save_diff_anim(anim, tmpdir, parallel=False, decode_frames=True, compress=True)
+    # Compare the embedded frames, after the player's code
+    payload, compressed_payload = (h.split("var diff_frames")[1] for h in (html, compressed_html))
+    assert len(compressed_payload) < len(payload) / 3
+
+
+@requires_node
+@pytest.mark.parametrize("level", [0, 1, 9])
+def test_inflate_fallback(level):
+    # Stored, fixed and dynamic huffman blocks
+    rng = random.Random(level)
+    text = "".join(rng.choice(["<path d=", "M 10 20 L ", str(rng.random()), "abc\n"]) for _ in range(20000))
+    compressed = base64.b64encode(zlib.compress(text.encode("ascii"), level)).decode("ascii")
+    script = re.search(r'<script language="javascript">(.*?)</script>', JS_INCLUDE, re.S).group(1)
+    code = f"delete globalThis.DecompressionStream;\n{script}\n" \
+        f"inflate({json.dumps(compressed)}).then(text => console.log(JSON.stringify(text)));"
+    out = subprocess.run(["node"], input=code, capture_output=True, text=True, check=True)
+    assert json.loads(out.stdout) == text
@@ -1,20 +1,96 @@
-import uuid
+import re
+import json
 import xml
+import zlib
+import shutil
+import subprocess
+import random
 import pytest
 import base64
 import functools
 import numpy as np
+from io import StringIO
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from PIL import Image
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation, HTMLWriter
-from matplotlib.backends.backend_svg import RendererSVG
 from matplotlib.testing.decorators import _raise_on_image_difference
 from matplotlib.testing.compare import convert
 
-from SVGFuncAnimation import SVGFuncAnimation
+from SVGFuncAnimation import (SVGFuncAnimation, _apply_attributes, _attribute_delta, _fragment_diff, _id_spans,
+                              _split_attributes, _svg_defs)
+
+
+# Just enough of a DOM to run the player in node, elements being their source, which setting
+# attributes rewrites. Those in the base document are added by get_player_code.
+PLAYER_DOM_STUB = r"""
+const elements = {};
+const START_TAG = /<[\w:.-]+(?:\s+[\w:.-]+="[^"]*")*\s*\/?>/g;
+const escapeXML = value => value.replace(/&/g, "&amp;").replace(/'/g, "&apos;").replace(/"/g, "&quot;")
+    .replace(/</g, "&lt;").replace(/>/g, "&gt;");
+class Element {
+  constructor(outerHTML = "") {
+    this.outerHTML = outerHTML;
+    this.parentNode = {replaceChild: (node, old) => { elements[old.id] = node; }};
+  }
+  get id() { return this.outerHTML.match(/id="([^"]*)"/)[1]; }
+  setAttribute(name, value) { this.setDescendantAttribute(0, name, value); }
+  getAttribute() {}
+  getElementsByTagName() {
+    const count = this.outerHTML.match(START_TAG).length;
+    return Array.from({length: count - 1}, (_, k) => ({
+      setAttribute: (name, value) => this.setDescendantAttribute(k + 1, name, value),
+      setAttributeNS: (ns, name, value) => this.setDescendantAttribute(k + 1, name, value),
+    }));
+  }
+  setDescendantAttribute(index, name, value) {
+    let k = 0;
+    this.outerHTML = this.outerHTML.replace(START_TAG, tag => k++ !== index ? tag :
+        tag.replace(new RegExp(`(\\s${name}=")[^"]*"`), (_, start) => start + escapeXML(value) + '"'));
+  }
+}
+globalThis.navigator = {userAgent: "node"};
+globalThis.document = new Proxy({
+  getElementById(id) {
+    return elements[id] || (elements[id] = new Element());
+  },
+  createElementNS() {
+    // Split innerHTML into its top level elements
+    return {set innerHTML(html) {
+      this.children = [];
+      let depth = 0, start;
+      for (const tag of html.matchAll(/<(?!!--)(\/?)[^>]*?(\/?)>/g)) {
+        if (!tag[1] && !depth) start = tag.index;
+        depth += tag[1] ? -1 : tag[2] ? 0 : 1;
+        if (!depth) this.children.push(new Element(html.slice(start, tag.index + tag[0].length)));
+      }
+    }};
+  }
+}, {get: (target, key) => key in target ? target[key] : {state: [{checked: true, value: "once"}]}});
+"""
+
+
+def get_base_fragments(html):
+    # The groups with an id in the player's base document, by id
+    document = re.search(r'<div id="_anim_doc[^"]*">(.*?)</div>\n  <div class="anim-controls">', html, re.S)
+    data = document.group(1).encode("utf-8")
+    return {gid: data[start:end].decode("utf-8") for gid, (start, end, _) in _id_spans(data).items()
+            if gid is not None}
+
+
+def get_player_code(html):
+    # The player's scripts, with the base document's groups and the json script elements
+    # holding the frames in the DOM stub
+    chunks = dict(re.findall(r'<script type="application/json" id="([^"]*)">(.*?)</script>', html, re.S))
+    scripts = "\n".join(re.findall(r'<script language="javascript">(.*?)</script>', html, re.S))
+    elements = "".join(f"elements[{json.dumps(id)}] = {{textContent: {json.dumps(data)}}};\n"
+                       for id, data in chunks.items())
+    elements += "".join(f"elements[{json.dumps(id)}] = new Element({json.dumps(fragment)});\n"
+                        for id, fragment in get_base_fragments(html).items())
+    return PLAYER_DOM_STUB + elements + scripts
 
 
 def make_same_size(path1, path2, method=min):
@@ -153,15 +229,7 @@ def test_text_animation(tmpdir, init_text, math_mode, index):
 @pytest.mark.parametrize("frames, save_count", [
     [10, None], [range(10), None], [iter(range(10)), 10], [lambda: range(10), 10]
 ])
-def test_frames_param_type(monkeypatch, frames, save_count):
-    def mock_uuid(*args, **kwargs):
-        class DummyUUID:
-            hex = 'ABCDEF'
-        return DummyUUID()
-
-    def mock_make_id(*args, **kwargs):
-        return 'dummyid1234'
-
+def test_frames_param_type(frames, save_count):
     def get_anim(frames, save_count, size=10):
         np.random.seed(0)
         fig = plt.figure()
@@ -177,15 +245,13 @@ def test_frames_param_type(monkeypatch, frames, save_count):
             index += 1
             return (l,)
 
-        anim = SVGFuncAnimation(fig, update_line, frames, save_count=save_count)
+        anim = SVGFuncAnimation(fig, update_line, frames, save_count=save_count, gid_prefix="anim")
         anim.grab_frames()
         plt.close(fig)
-        return anim._embedded_frames
+        return [{gid: anim._artist_fragment(index, gid) for gid in frame}
+                for index, frame in enumerate(anim._embedded_frames)]
 
-    # Remove all randomness associated with unique ids in the end SVG
-    # this enables us to compare the SVGs directly without inkscape
-    monkeypatch.setattr(uuid, 'uuid4', mock_uuid)
-    monkeypatch.setattr(RendererSVG, '_make_id', mock_make_id)
+    # With the same gid prefix, the SVGs can be compared directly without inkscape
     assert get_anim(range(10), 10) == get_anim(frames, save_count)
 
 
@@ -201,6 +267,492 @@ def test_embed_limit(caplog, tmpdir):
     #         and record.levelname == "WARNING")
 
 
+@pytest.mark.parametrize("compress", [True, 1])
+def test_compress(tmpdir, compress):
+    anim = get_line_anim(functools.partial(SVGFuncAnimation, compress=compress), 5)
+    path = Path(tmpdir, "temp.html")
+    anim.save(str(path))
+    payload = re.search(r'inflateFrames\("([^"]*)"\)', path.read_text()).group(1)
+    entries = json.loads(zlib.decompress(base64.b64decode(payload)))
+    assert [entry for entry in entries if isinstance(entry, str)] == anim._fragments
+    assert [entry for entry in entries if isinstance(entry, dict)] == anim._embedded_frames
+
+
+def test_fragment_dedup(tmpdir):
+    # A periodic animation only stores each distinct fragment once
+    fig = plt.figure()
+    (l,) = plt.plot([0, 1], [0, 1], "r-")
+
+    def update_line(num):
+        l.set_ydata([num % 3, 1])
+        return (l,)
+
+    anim = SVGFuncAnimation(fig, update_line, range(12))
+    plt.close(fig)
+    frames = [anim.grab_frame(i) for i in range(12)]
+    assert len(anim._fragments) == 3
+    assert frames[:3] * 4 == frames and len(set(frames)) == 3
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_fragment_diff(seed):
+    rng = random.Random(seed)
+    old = "".join(rng.choice("ab<>") for _ in range(rng.randint(0, 50)))
+    new = old
+    for _ in range(rng.randint(0, 3)):
+        i, j = sorted(rng.randint(0, len(new)) for _ in range(2))
+        new = new[:i] + "".join(rng.choice("abc") for _ in range(rng.randint(0, 5))) + new[j:]
+    [[low, high, data]] = _fragment_diff(old, new)
+    assert old[:low] + data + old[high:] == new
+
+
+def test_id_spans():
+    document = ('<svg><g id="a"><!-- −1 --><g id="b"/><text>−x</text>\n<g id="c">\n<g><g id="d">é</g></g>'
+                '</g></g><g id="e"></g><g id="f"/></svg>')
+    data = document.encode("utf-8")
+    spans = _id_spans(data)
+    assert {gid: data[start:end].decode("utf-8") for gid, (start, end, _) in spans.items() if gid} == {
+        "a": document[5:document.index('<g id="e"')], "b": '<g id="b"/>',
+        "c": '<g id="c">\n<g><g id="d">é</g></g></g>', "d": '<g id="d">é</g>', "e": '<g id="e"></g>',
+        "f": '<g id="f"/>'}
+    assert {gid: children for gid, (_, _, children) in spans.items()} == {
+        None: ["a", "e", "f"], "a": ["b", "c"], "b": [], "c": ["d"], "d": [], "e": [], "f": []}
+
+
+@pytest.mark.parametrize("old, new, delta", [
+    ['<g id="a">\n <path d="M 0 0" style="x"/>\n</g>\n', '<g id="a">\n <path d="M 1 1" style="x"/>\n</g>\n',
+     {"1": {"d": "M 1 1"}}],
+    ['<g id="a" x="1"><path d="a"/><use xlink:href="#b" x="&quot;"/></g>',
+     '<g id="a" x="2"><path d="a"/><use xlink:href="#c" x="&lt;"/></g>', {"0": {"x": "2"}, "2": {"xlink:href": "#c", "x": "&lt;"}}],
+    ['<g id="a"><path d="a"/></g>', '<g id="a"><path d="a"/><path d="b"/></g>', None],
+    ['<g id="a"><path d="a"/></g>', '<g id="a"><path d="a" style="x"/></g>', None],
+    ['<g id="a"><text x="1">a="b"</text></g>', '<g id="a"><text x="1">a="c"</text></g>', None],
+])
+def test_attribute_delta(old, new, delta):
+    # Only attribute values may differ, the rest is the same
+    assert _attribute_delta(_split_attributes(old), _split_attributes(new)) == delta
+    if delta is not None:
+        assert _apply_attributes(old, delta) == new
+
+
+def test_diff_fragments():
+    def get_anim_frames(**kwargs):
+        anim = get_line_anim(functools.partial(SVGFuncAnimation, gid_prefix="anim", **kwargs), 20)
+        return [anim.grab_frame(i) for i in range(20)], anim
+    # A growing line only sends the new points
+    frames, anim = get_anim_frames()
+    diff_frames, diff_anim = get_anim_frames(diff_fragments=True)
+    assert diff_frames == frames
+    assert len(diff_anim._fragments) == 1
+    assert diff_anim._total_bytes < anim._total_bytes / 3
+
+
+@pytest.mark.parametrize("diff_fragments", [False, True])
+def test_iter_frames(diff_fragments):
+    anim = get_line_anim(functools.partial(SVGFuncAnimation, diff_fragments=diff_fragments), 10)
+    assert list(anim.iter_frames()) == [anim.grab_frame(i) for i in range(10)]
+
+
+def get_alternating_anim(size, **kwargs):
+    # Two lines, only one of which is updated in each frame
+    fig = plt.figure()
+    lines = plt.plot([0, 1], [0, 1], "r-") + plt.plot([0, 1], [1, 0], "b-")
+
+    def update(num):
+        line = lines[num % 2]
+        line.set_data(range(num + 2), np.linspace(0, 1, num + 2) ** (num % 3 + 1))
+        return (line,)
+
+    anim = SVGFuncAnimation(fig, update, range(size), **kwargs)
+    plt.close(fig)
+    anim.grab_frames()
+    return anim, [line.get_gid() for line in lines]
+
+
+@pytest.mark.parametrize("keyframe_interval", [None, 2, 3])
+@pytest.mark.parametrize("diff_fragments", [False, True])
+def test_iter_frames_cumulative(keyframe_interval, diff_fragments):
+    # Artists that aren't drawn in a frame keep their latest fragment
+    anim, gids = get_alternating_anim(10, keyframe_interval=keyframe_interval, diff_fragments=diff_fragments)
+    frames = list(anim.iter_frames())
+    for index, frame in enumerate(frames):
+        for k, gid in enumerate(gids):
+            latest = max((i for i in range(index + 1) if i % 2 == k), default=None)
+            if latest is not None:
+                assert anim._artist_fragment(latest, gid) in frame
+    # Seeking gives the same frames, in any order
+    assert [anim.grab_frame(i) for i in [9, 3, 0, 7, 4, 8, 1, 2, 6, 5]] == \
+        [frames[i] for i in [9, 3, 0, 7, 4, 8, 1, 2, 6, 5]]
+    if keyframe_interval:
+        assert sorted(anim._keyframes) == list(range(keyframe_interval, 10, keyframe_interval))
+
+
+def test_skip_unchanged():
+    # Every artist is returned but only the changed ones are kept
+    fig = plt.figure()
+    lines = plt.plot([0, 1], [0, 1], "r-") + plt.plot([0, 1], [1, 0], "b-")
+
+    def update(num):
+        lines[0].set_ydata([min(num, 3) / 10, 1])
+        return lines
+
+    anim = SVGFuncAnimation(fig, update, range(6))
+    plt.close(fig)
+    anim.grab_frames()
+    assert list(map(len, anim._embedded_frames)) == [2, 1, 1, 1, 0, 0]
+    frames = list(anim.iter_frames())
+    assert frames[3] == frames[4] == frames[5]
+    assert [anim.grab_frame(i) for i in range(6)] == frames
+
+
+def line_anim_factory():
+    # Top level so that it can be pickled
+    fig = plt.figure()
+    data = np.random.RandomState(0).rand(12)
+    (l,) = plt.plot([], [], "ro-")
+    plt.xlim(0, 11)
+    plt.ylim(0, 1)
+
+    def update_line(num):
+        l.set_data(range(num + 1), data[:num + 1])
+        return (l,)
+
+    return fig, update_line
+
+
+def test_workers():
+    anim = SVGFuncAnimation(*line_anim_factory(), range(12), factory=line_anim_factory, gid_prefix="anim")
+    parallel_anim = SVGFuncAnimation(*line_anim_factory(), range(12), factory=line_anim_factory,
+                                     gid_prefix="anim", workers=3)
+    frames, parallel_frames = list(anim.iter_frames()), list(parallel_anim.iter_frames())
+    # The same frames, with the same defs in another order
+    defs = re.compile(r"\s*<defs>.*?</defs>", re.S)
+    assert [defs.sub("", frame) for frame in parallel_frames] == [defs.sub("", frame) for frame in frames]
+    assert [_svg_defs(frame) for frame in parallel_frames] == [_svg_defs(frame) for frame in frames]
+    with pytest.raises(ValueError):
+        SVGFuncAnimation(*line_anim_factory(), range(12), workers=3)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is needed to run the player")
+@pytest.mark.parametrize("options", [{}, {"keyframe_interval": 3, "diff_fragments": True},
+                                     {"keyframe_interval": 2, "compress": True}, {"chunk_size": None},
+                                     {"keyframe_interval": 3, "diff_fragments": True, "chunk_size": 2}])
+def test_player_seek(tmpdir, options):
+    anim, gids = get_alternating_anim(12, **options)
+    check_player_seek(anim, gids, [0, 1, 2, 9, 3, 11, 10, 4, 5, 0, 7, 8, 1], tmpdir)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is needed to run the player")
+@pytest.mark.parametrize("options", [{}, {"keyframe_interval": 2, "diff_fragments": True}])
+def test_player_seek_text(tmpdir, options):
+    # Text fragments hold comments, which aren't elements
+    fig = plt.figure()
+    txt = plt.text(0.5, 0.5, "First")
+
+    def update(num):
+        txt.set_text(["First", "Second", "Third"][num % 3])
+        txt.set_x(num / 10)
+        return (txt,)
+
+    anim = SVGFuncAnimation(fig, update, range(6), **options)
+    plt.close(fig)
+    anim.grab_frames()
+    check_player_seek(anim, [txt.get_gid()], [0, 4, 1, 5, 2, 0, 3], tmpdir)
+
+
+def check_player_seek(anim, gids, order, tmpdir):
+    # The groups gids shown by the player after seeking to each frame of order in turn
+    path = Path(tmpdir, "temp.html")
+    anim.save(str(path))
+    html = path.read_text()
+    anim_id = re.search(r"(anim\w+) = new Animation", html).group(1)
+    code = get_player_code(html) + f"""
+        ;(function start() {{
+            if (typeof {anim_id} === "undefined") return setTimeout(start, 1);
+            const shown = [];
+            for (const i of {order}) {{
+                {anim_id}.set_frame(i);
+                shown.push({json.dumps(gids)}.map(id => document.getElementById(id).outerHTML));
+            }}
+            console.log(JSON.stringify(shown));
+        }})();"""
+    out = subprocess.run(["node"], input=code, capture_output=True, text=True, check=True)
+    base, expected = get_base_fragments(html), []
+    for i in order:
+        latest = anim._artist_frames(i)
+        expected.append([(anim._artist_fragment(latest[gid], gid) if gid in latest else base[gid]).strip()
+                         for gid in gids])
+    assert json.loads(out.stdout) == expected
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is needed to run the player")
+def test_player_attribute_deltas(tmpdir):
+    anim, gids = get_alternating_anim(8)
+    assert all(isinstance(entry, dict) for frame in anim._embedded_frames[2:] for entry in frame.values())
+    path = Path(tmpdir, "temp.html")
+    anim.save(str(path))
+    html = path.read_text()
+    anim_id = re.search(r"(anim\w+) = new Animation", html).group(1)
+    # The second line is parsed and looked up when first drawn, after which the lines'
+    # attributes are set instead, on the elements already found
+    code = get_player_code(html) + f"""
+        ;(function start() {{
+            if (typeof {anim_id} === "undefined") return setTimeout(start, 1);
+            const anim = {anim_id}, counts = {{parsed: 0, lookups: 0}};
+            const createElementNS = document.createElementNS, getElementById = document.getElementById;
+            document.createElementNS = function() {{ counts.parsed++; return createElementNS(); }};
+            document.getElementById = function(id) {{ counts.lookups += id.startsWith("{anim._gid_prefix}_"); return getElementById(id); }};
+            for (let i = 1; i < 8; i++) anim.set_frame(i);
+            document.getElementById = getElementById;
+            const shown = {json.dumps(gids)}.map(id => document.getElementById(id).outerHTML);
+            console.log(JSON.stringify([counts, shown]));
+        }})();"""
+    out = subprocess.run(["node"], input=code, capture_output=True, text=True, check=True)
+    counts, shown = json.loads(out.stdout)
+    assert counts == {"parsed": 1, "lookups": 1}
+    assert shown == [anim._artist_fragment(6, gids[0]).strip(), anim._artist_fragment(7, gids[1]).strip()]
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is needed to run the player")
+def test_player_chunks(tmpdir):
+    anim = get_line_anim(functools.partial(SVGFuncAnimation, chunk_size=4, keyframe_interval=3), 10)
+    path = Path(tmpdir, "temp.html")
+    anim.save(str(path))
+    html = path.read_text()
+    # Each chunk refers to the fragments of those before it, and its own
+    chunks = [json.loads(data.replace("<\\/", "</")) for data in
+              re.findall(r'<script type="application/json" id="[^"]*">(.*?)</script>', html)]
+    entries = [entry for chunk in chunks for entry in chunk]
+    assert [len([entry for entry in chunk if isinstance(entry, dict)]) for chunk in chunks] == [4, 4, 2]
+    assert [entry for entry in entries if isinstance(entry, str)] == anim._fragments
+    assert [entry for entry in entries if isinstance(entry, dict)] == anim._embedded_frames
+    assert {entry[0]: entry[1] for entry in entries if isinstance(entry, list)} == anim._keyframes
+    anim_id = re.search(r"(anim\w+) = new Animation", html).group(1)
+    # Only the first chunk is parsed to show the first frame, and the next one ahead of playback
+    code = get_player_code(html) + f"""
+        ;(function start() {{
+            if (typeof {anim_id} === "undefined") return setTimeout(start, 1);
+            const parsed = [{anim_id}.parsed_chunks];
+            setTimeout(() => {{
+                parsed.push({anim_id}.parsed_chunks);
+                {anim_id}.set_frame(9);
+                parsed.push({anim_id}.parsed_chunks, {anim_id}.frames.length);
+                console.log(JSON.stringify(parsed));
+            }}, 5);
+        }})();"""
+    out = subprocess.run(["node"], input=code, capture_output=True, text=True, check=True)
+    assert json.loads(out.stdout) == [1, 2, 3, 10]
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is needed to run the player")
+@pytest.mark.parametrize("options", [{}, {"keyframe_interval": 5, "diff_fragments": True}])
+def test_player_drop_frames(tmpdir, options):
+    anim, gids = get_alternating_anim(60, **options)
+    path = Path(tmpdir, "temp.html")
+    anim.save(str(path))
+    html = path.read_text()
+    anim_id = re.search(r"(anim\w+) = new Animation", html).group(1)
+    # Frames taking longer than the interval are skipped, only the latest fragments being shown
+    code = get_player_code(html) + f"""
+        ;(function start() {{
+            if (typeof {anim_id} === "undefined") return setTimeout(start, 1);
+            const anim = {anim_id}, set_frame = anim.set_frame, frames = [], shown = [];
+            anim.set_frame = function(frame) {{
+                const start = Date.now();
+                while (Date.now() - start < 30);
+                set_frame.call(this, frame);
+                frames.push(frame);
+                shown.push({json.dumps(gids)}.map(id => document.getElementById(id).outerHTML));
+            }};
+            anim.interval = 10;
+            anim.play_animation();
+            const wait = setInterval(() => {{
+                if (anim.direction) return;
+                clearInterval(wait);
+                console.log(JSON.stringify([frames, shown, anim.stats]));
+            }}, 5);
+        }})();"""
+    out = subprocess.run(["node"], input=code, capture_output=True, text=True, check=True)
+    frames, shown, stats = json.loads(out.stdout)
+    assert frames == sorted(frames) and frames[-1] == 59 and len(frames) < 30
+    assert stats["dropped"] > 0 and stats["shown"] + stats["dropped"] >= 59
+    assert 0 < stats["fps"] < 40
+    base, expected = get_base_fragments(html), []
+    for i in frames:
+        latest = anim._artist_frames(i)
+        expected.append([(anim._artist_fragment(latest[gid], gid) if gid in latest else base[gid]).strip()
+                         for gid in gids])
+    assert shown == expected
+
+
+@pytest.mark.parametrize("returns, blit", [[True, False], [False, True], [False, False]])
+def test_find_changes(caplog, returns, blit):
+    # Without the artists that changed, the whole figure is drawn to find them
+    def get_frames(returns, blit):
+        fig = plt.figure()
+        lines = plt.plot([0, 1], [0, 1], "r-") + plt.plot([0, 1], [1, 0], "bo-")
+
+        def update_line(num):
+            lines[num % 2].set_ydata([num / 10, 1])
+            return (lines[num % 2],) if returns else None
+
+        anim = SVGFuncAnimation(fig, update_line, range(6), blit=blit, gid_prefix="anim")
+        plt.close(fig)
+        # Up to whitespace, as unchanged artists are left as they are in the base document
+        return [" ".join(frame.split()).replace("> <", "><") for frame in anim.iter_frames()], anim
+    caplog.set_level("WARNING")
+    frames, anim = get_frames(returns, blit)
+    assert frames == get_frames(True, True)[0]
+    assert [len(frame) for frame in anim._embedded_frames] == [0, 1, 1, 1, 1, 1]
+    assert len(caplog.records) == (not returns and blit)
+
+
+def get_lines_figure(data, num):
+    # A line per frame (up to num), the first of which is removed after 3 frames
+    fig = plt.figure()
+    lines = [plt.plot(data[i], "o-")[0] for i in range(num + 1)]
+    if num > 3:
+        lines[0].remove()
+    plt.xlim(0, 2 + num)
+    return fig
+
+
+def test_new_artists(caplog):
+    data = np.random.RandomState(0).rand(6, 3)
+
+    def update(num):
+        plt.plot(data[num], "o-")
+        if num == 4:
+            ax.lines[0].remove()
+        ax.set_xlim(0, 2 + num)
+
+    caplog.set_level("WARNING")
+    fig = plt.figure()
+    ax = plt.gca()
+    anim = SVGFuncAnimation(fig, update, range(6))
+    frames = list(anim.iter_frames())
+    plt.close(fig)
+    assert len(caplog.records) == 1 and "slower" in caplog.records[0].getMessage()
+
+    # The same paths (up to unused glyphs) as the figure drawn from scratch
+    def paths(document):
+        document = re.sub(r"<defs>.*?</defs>", "", document, flags=re.S)
+        return sorted(" ".join(d.split()) for d in re.findall(r' d="([^"]*)"', document))
+    for num, frame in enumerate(frames):
+        expected = get_lines_figure(data, num)
+        with StringIO() as f:
+            expected.savefig(f, format="svg")
+            plt.close(expected)
+            assert paths(frame) == paths(f.getvalue())
+
+
+def test_new_artists_blit(tmpdir):
+    # func returning a new artist, along with the ones it changed
+    data = np.random.RandomState(0).rand(6, 3)
+    fig = plt.figure()
+    (line,) = plt.plot(data[0], "o-")
+    plt.xlim(0, 2)
+    plt.ylim(0, 1)
+    new_lines = []
+
+    def update(num):
+        line.set_ydata(data[num])
+        if num == 2:
+            new_lines.append(plt.plot(data[5], "o-")[0])
+        return [line] + new_lines
+
+    anim = SVGFuncAnimation(fig, update, range(4))
+    frames = list(anim.iter_frames())
+    plt.close(fig)
+    assert all(gid.startswith(anim._gid_prefix + "_") for frame in anim._embedded_frames for gid in frame)
+    anim.save(str(Path(tmpdir, "temp.html")))
+
+    def paths(document):
+        document = re.sub(r"<defs>.*?</defs>", "", document, flags=re.S)
+        return sorted(" ".join(d.split()) for d in re.findall(r' d="([^"]*)"', document))
+    for num, frame in enumerate(frames):
+        expected = plt.figure()
+        plt.plot(data[num], "o-")
+        if num >= 2:
+            plt.plot(data[5], "o-")
+        plt.xlim(0, 2)
+        plt.ylim(0, 1)
+        with StringIO() as f:
+            expected.savefig(f, format="svg")
+            plt.close(expected)
+            assert paths(frame) == paths(f.getvalue())
+
+
+@pytest.mark.parametrize("math_mode", [True, False])
+def test_empty_text_blit(tmpdir, math_mode):
+    # A text that's empty at first isn't in the base document, it's drawn with the figure
+    # (glyph ids being the same, unlike those of markers)
+    def glyphs(document):
+        document = re.sub(r"<defs>.*?</defs>", "", document, flags=re.S)
+        return sorted(re.findall(r'<use xlink:href="#DejaVu[^"]*"[^>]*>|transform="[^"]*"', document))
+    func_frames = get_text_anim_frames(FuncAnimation, 3, tmpdir, init_text="", math_mode=math_mode)
+    svg_frames = get_text_anim_frames(SVGFuncAnimation, 3, tmpdir, init_text="", math_mode=math_mode)
+    assert [glyphs(frame) for frame in svg_frames] == [glyphs(frame) for frame in func_frames]
+
+
+def test_gouraud_gradients():
+    # Gradients are drawn in the artist's own defs, which are left in place
+    rng = np.random.RandomState(0)
+    fig = plt.figure()
+    mesh = plt.tripcolor([0, 1, 0, 1], [0, 0, 1, 1], rng.rand(4), shading="gouraud")
+
+    def update(num):
+        mesh.set_array(rng.rand(4))
+        return (mesh,)
+
+    anim = SVGFuncAnimation(fig, update, range(3))
+    frames = list(anim.iter_frames())
+    plt.close(fig)
+    for frame in frames:
+        references = set(re.findall(r'url\(#(GR[^)]+)\)', frame))
+        assert references and references <= set(re.findall(r'<linearGradient id="([^"]+)"', frame))
+
+
+def test_gid_prefix(tmpdir):
+    def get_html(size=5, **kwargs):
+        anim = get_line_anim(functools.partial(SVGFuncAnimation, **kwargs), size, fmt="ro-")
+        anim.save(str(Path(tmpdir, "temp.html")))
+        return Path(tmpdir, "temp.html").read_text()
+    # The same animation gives the same html, by default too, and other animations other ids
+    html = get_html(gid_prefix="anim")
+    assert get_html(gid_prefix="anim") == html
+    assert 'id="anim_1"' in html and "animanim = new Animation" in html
+    assert get_html() == get_html()
+    prefixes = [re.search(r"anim(\w+) = new Animation", get_html(size)).group(1) for size in [5, 6]]
+    assert prefixes[0] != prefixes[1]
+
+    def get_prefix(fmt):
+        # Animations of different figures by functions of the same name
+        fig = plt.figure()
+        (line,) = plt.plot([0, 1], [0, 1], fmt)
+
+        def animate(num):
+            line.set_ydata([num / 10, 1])
+            return (line,)
+
+        anim = SVGFuncAnimation(fig, animate, range(10))
+        anim.grab_frames()
+        plt.close(fig)
+        return anim._gid_prefix
+    assert get_prefix("r-") != get_prefix("b-")
+    assert get_prefix("r-") == get_prefix("r-")
+
+
+def test_save_frames(tmpdir):
+    anim = get_line_anim(SVGFuncAnimation, 12)
+    converted = []
+    with ThreadPoolExecutor(2) as executor:
+        paths = anim.save_frames(Path(tmpdir, "frames"), convert=converted.append, executor=executor)
+    assert [path.name for path in paths] == [f"frame{i:02d}.svg" for i in range(12)]
+    assert sorted(converted) == paths
+    assert [path.read_text() for path in paths] == list(anim.iter_frames())
+
+
 # TODO:
 #   [x] Add + test embed limit rcParam
 #   [x] Add + Test frames param int/generator/None
@@ -210,11 +762,10 @@ def test_embed_limit(caplog, tmpdir):
 #       - Text works differently, we need a test
 #   [x] Test grab_frame returns valid XML doc
 #   [x] Test init_func vs no init_func
-#   [ ] Test user func returns unknown artist
-#       - This currently throws an error, can we instead redraw the whole
-#         thing, figure out what's changed and only emit a (performance) warning?
-#   [ ] Test user func returns None
-#       - Is this something we should support?
+#   [x] Test user func returns unknown artist
+#       - The whole figure is redrawn to figure out what's changed, with a
+#         (performance) warning
+#   [x] Test user func returns None
 #         We would need to track what artists changed, OR redraw all...
 #           * We can set everything in the figure to animated and then redraw all
 #             artists that are stale, visible and aren't empty Text artists. This